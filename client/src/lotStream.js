@@ -0,0 +1,39 @@
+// client/src/lotStream.js
+// Live lot availability from the /api/lots/stream Server-Sent Events endpoint.
+// The server sends a "snapshot" (same rows as /api/lots/summary) on connect
+// and "lots" events with only the changed rows afterwards.
+
+// flatten a /api/lots/summary row into the lot object the views render
+export function summaryToLot(row) {
+  return {
+    ...row.lot,
+    total_spots: row.total_spots,
+    occupied: row.occupied,
+    available: row.available,
+    version: row.version,
+  };
+}
+
+// apply a "lots" event ({ lots: [rows], deleted: [ids] }) to a list of lots;
+// a row older (lower version) than the one already shown is ignored
+export function applyLotChanges(lots, { lots: changed = [], deleted = [] }) {
+  const next = lots.filter((l) => !deleted.includes(l.id));
+  for (const row of changed) {
+    const lot = summaryToLot(row);
+    const i = next.findIndex((l) => l.id === lot.id);
+    if (i < 0) next.push(lot);
+    else if (!(next[i].version > lot.version)) next.splice(i, 1, lot);
+  }
+  return next.sort((a, b) => a.id - b.id);
+}
+
+// open the stream; returns the EventSource (call .close() on unmount) or null
+// when unsupported. If the server has no stream (503) the browser closes it and
+// the caller's one-off /api/lots/summary load stays the data source.
+export function openLotStream(baseURL, { onSnapshot, onChange }) {
+  if (typeof EventSource === "undefined") return null;
+  const es = new EventSource(`${baseURL || ""}/api/lots/stream`);
+  es.addEventListener("snapshot", (ev) => onSnapshot(JSON.parse(ev.data).summary.map(summaryToLot)));
+  es.addEventListener("lots", (ev) => onChange(JSON.parse(ev.data)));
+  return es;
+}
@@ -0,0 +1,120 @@
+# scripts/bench_cache_codecs.py
+"""
+Micro-benchmark of the cache codecs (server/utils/codecs.py): encode and
+decode time and stored size for each codec / compression pair, on payloads
+shaped like the cached views (reservation history page, analytics summary,
+lot summary row).
+
+If a Redis server answers at REDIS_URL, each encoded value is also written
+to a throwaway key and its MEMORY USAGE reported; nothing else is touched.
+Codecs whose package is not installed (msgpack, brotli) are skipped.
+
+Usage: python scripts/bench_cache_codecs.py [iterations]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.utils.codecs import CODECS, COMPRESSORS, encode, decode, DEFAULT_COMPRESS_MIN_BYTES
+
+T0 = datetime(2025, 1, 1, 8, 0)
+
+
+def reservation(i):
+    start = T0 - timedelta(hours=3 * i)
+    lot_id = i % 7 + 1
+    return {
+        'id': 10000 - i, 'user_id': 42,
+        'start_time': start.isoformat(), 'end_time': (start + timedelta(hours=2)).isoformat(),
+        'duration_seconds': 7200, 'cost': 60.0, 'notes': None, 'remarks': None,
+        'spot_id': 500 + i % 40, 'spot_number': str(i % 40 + 1), 'spot_status': 'A',
+        'lot_id': lot_id, 'lot_name': f'Lot {lot_id}',
+        'lot': {'id': lot_id, 'name': f'Lot {lot_id}', 'address': f'{lot_id} Main Street', 'price_per_hour': 30.0}
+    }
+
+
+def lot_row(i):
+    return {
+        'lot': {'id': i, 'name': f'Lot {i}', 'address': f'{i} Main Street', 'pin_code': '560001',
+                'price_per_hour': 30.0, 'capacity': 120},
+        'total_spots': 120, 'occupied': i * 7 % 120, 'available': 120 - i * 7 % 120
+    }
+
+
+def analytics_summary(lots=20):
+    return {
+        'total_revenue': 123456.0,
+        'revenue_per_lot': [{'lot_id': i, 'lot_name': f'Lot {i}', 'revenue': 1000.0 * i} for i in range(1, lots + 1)],
+        'occupancy': [{'lot_id': i, 'lot_name': f'Lot {i}', 'total_spots': 120, 'occupied': i,
+                       'available': 120 - i} for i in range(1, lots + 1)],
+        'reservations_last_30_days': [{'date': (T0 - timedelta(days=d)).date().isoformat(), 'count': d * 3}
+                                      for d in range(30)],
+        'recent_reservations': [{
+            'id': 10000 - i, 'user': {'id': i, 'username': f'user{i}'}, 'lot': {'id': 1, 'name': 'Lot 1'},
+            'spot_number': str(i), 'start_time': T0.isoformat(), 'end_time': None, 'cost': 0.0, 'notes': None
+        } for i in range(20)]
+    }
+
+
+PAYLOADS = {
+    'lot summary row': lot_row(3),
+    'history page (50)': {'reservations': [reservation(i) for i in range(50)], 'next_cursor': 'MjAyNC0xMi0yNQ=='},
+    'history page (500)': {'reservations': [reservation(i) for i in range(500)], 'next_cursor': None},
+    'analytics summary': {'v': analytics_summary(), 'd': 0.05, 'e': 1735718400.0},
+}
+
+
+def redis_client():
+    try:
+        import redis
+        r = redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'), socket_timeout=1)
+        r.ping()
+        return r
+    except Exception:
+        return None
+
+
+def per_call_us(fn, arg, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(arg)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    r = redis_client()
+    codecs = [name for name, spec in CODECS.items() if spec[3]]
+    compressions = [name for name, spec in COMPRESSORS.items() if spec[3]]
+    skipped = [name for name, spec in list(CODECS.items()) + list(COMPRESSORS.items()) if not spec[3]]
+
+    print(f"{ITERATIONS} iterations, compression threshold {DEFAULT_COMPRESS_MIN_BYTES} B, "
+          f"Redis MEMORY USAGE: {'yes' if r else 'n/a (no server at REDIS_URL)'}")
+    if skipped:
+        print("not installed, skipped:", ", ".join(skipped))
+
+    for label, payload in PAYLOADS.items():
+        print(f"\n{label}")
+        print(f"  {'codec':<8} {'compr':<7} {'bytes':>8} {'encode us':>10} {'decode us':>10} {'redis B':>8}")
+        n = max(ITERATIONS // (10 if '500' in label else 1), 10)
+        for codec in codecs:
+            for compression in compressions:
+                blob = encode(payload, codec, compression)
+                assert decode(blob) == decode(encode(payload, 'json', 'none'))
+                enc = per_call_us(lambda v: encode(v, codec, compression), payload, n)
+                dec = per_call_us(decode, blob, n)
+                mem = ''
+                if r is not None:
+                    key = f"bench:codec:{codec}:{compression}"
+                    r.set(key, blob, ex=60)
+                    mem = r.memory_usage(key)
+                    r.delete(key)
+                print(f"  {codec:<8} {compression:<7} {len(blob):>8} {enc:>10.1f} {dec:>10.1f} {mem!s:>8}")
+
+
+if __name__ == "__main__":
+    main()
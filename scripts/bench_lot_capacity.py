@@ -0,0 +1,101 @@
+# scripts/bench_lot_capacity.py
+"""
+Benchmark spot generation for lot capacity changes: the old per-object ORM
+path (session.add per spot / session.delete per spot) versus the bulk
+helpers used by create_lot / edit_lot (one executemany INSERT, one
+DELETE ... WHERE id IN (...)).
+
+Runs against a throwaway SQLite file, never against your real database.
+
+Usage: python scripts/bench_lot_capacity.py [spots] [rounds]
+"""
+import os
+import sys
+import tempfile
+import time
+
+SPOTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+tmpdir = tempfile.mkdtemp(prefix="findmyspot-bench-")
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.app import create_app
+from server.models import db
+from server.models.lot import ParkingLot
+from server.models.spot import ParkingSpot
+from server.controllers._lot_utils import bulk_add_spots, bulk_remove_free_spots
+
+
+def new_lot(name):
+    lot = ParkingLot(name=name, capacity=SPOTS, price_per_hour=1.0, occupied_count=0, available_count=SPOTS)
+    db.session.add(lot)
+    db.session.flush()
+    return lot
+
+
+def legacy_create():
+    lot = new_lot("legacy")
+    for i in range(1, SPOTS + 1):
+        db.session.add(ParkingSpot(lot_id=lot.id, number=str(i), status='A'))
+    db.session.commit()
+    return lot.id
+
+
+def legacy_shrink(lot_id):
+    lot = db.session.get(ParkingLot, lot_id)
+    # old edit_lot read every spot just to find the max number
+    nums = [int(s.number) for s in lot.spots if str(s.number).isdigit()]
+    max(nums)
+    spots = ParkingSpot.query.filter_by(lot_id=lot_id, status='A') \
+        .order_by(ParkingSpot.id.desc()).limit(SPOTS // 2).all()
+    for sp in spots:
+        db.session.delete(sp)
+    db.session.commit()
+
+
+def bulk_create():
+    lot = new_lot("bulk")
+    bulk_add_spots(lot.id, SPOTS, start_number=0)
+    db.session.commit()
+    return lot.id
+
+
+def bulk_shrink(lot_id):
+    bulk_remove_free_spots(lot_id, SPOTS // 2)
+    db.session.commit()
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - t0, out
+
+
+def main():
+    app = create_app()
+    app.redis = None
+    with app.app_context():
+        db.create_all()
+        results = {'legacy create': [], 'legacy shrink': [], 'bulk create': [], 'bulk shrink': []}
+        for _ in range(ROUNDS):
+            dt, lot_id = timed(legacy_create)
+            results['legacy create'].append(dt)
+            results['legacy shrink'].append(timed(legacy_shrink, lot_id)[0])
+            db.session.expunge_all()
+
+            dt, lot_id = timed(bulk_create)
+            results['bulk create'].append(dt)
+            results['bulk shrink'].append(timed(bulk_shrink, lot_id)[0])
+            db.session.expunge_all()
+
+    print(f"{SPOTS} spots, best of {ROUNDS} rounds (SQLite at {tmpdir})")
+    for name, times in results.items():
+        print(f"  {name:<14} {min(times) * 1000:9.1f} ms")
+    for op in ('create', 'shrink'):
+        print(f"  {op} speedup: {min(results['legacy ' + op]) / min(results['bulk ' + op]):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# scripts/bench_occupancy.py
+"""
+Benchmark the hourly occupancy engine (server/utils/occupancy.py) on
+synthetic reservation intervals: the NumPy sweep line (if NumPy is
+installed), the pure-Python sweep line, and a naive per-hour overlap scan
+on a small sample for reference. Also checks that the engines agree.
+
+Usage: python scripts/bench_occupancy.py [intervals] [days]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from server.utils import occupancy
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+DAYS = int(sys.argv[2]) if len(sys.argv) > 2 else 28
+NAIVE_SAMPLE = 2000
+
+
+def make_intervals(n, start, days):
+    rnd = random.Random(42)
+    out = []
+    for _ in range(n):
+        s = start + timedelta(seconds=rnd.randint(-86400, days * 86400))
+        e = None if rnd.random() < 0.02 else s + timedelta(seconds=rnd.randint(60, 6 * 3600))
+        out.append((s, e))
+    return out
+
+
+def naive(intervals, start, end, now):
+    hours = int((end - start).total_seconds() // 3600)
+    out = [0.0] * hours
+    for k in range(hours):
+        b0 = start + timedelta(hours=k)
+        b1 = b0 + timedelta(hours=1)
+        for s, e in intervals:
+            overlap = (min(e or now, b1) - max(s, b0)).total_seconds()
+            if overlap > 0:
+                out[k] += overlap
+    return out
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    start = datetime(2026, 1, 5)
+    end = start + timedelta(days=DAYS)
+    now = end
+    intervals = make_intervals(N, start, DAYS)
+    print(f"{N} intervals over {DAYS} days ({DAYS * 24} hourly buckets)")
+
+    numpy_mod = occupancy.np
+    results = {}
+    if numpy_mod is not None:
+        results['numpy'], t = timed(occupancy.occupied_seconds, intervals, start, end, now=now)
+        print(f"  numpy sweep line   {t * 1000:9.1f} ms")
+    occupancy.np = None
+    try:
+        results['python'], t = timed(occupancy.occupied_seconds, intervals, start, end, now=now)
+        print(f"  python sweep line  {t * 1000:9.1f} ms")
+    finally:
+        occupancy.np = numpy_mod
+
+    sample = intervals[:NAIVE_SAMPLE]
+    expected, t = timed(naive, sample, start, end, now)
+    print(f"  naive per-hour     {t * 1000:9.1f} ms for {len(sample)} intervals "
+          f"(~{t * N / len(sample):.1f} s extrapolated)")
+    got = occupancy.occupied_seconds(sample, start, end, now=now)
+    assert max(abs(a - b) for a, b in zip(expected, got)) < 1e-6, "engine disagrees with naive scan"
+    if len(results) == 2:
+        assert max(abs(a - b) for a, b in zip(results['numpy'], results['python'])) < 1e-6, \
+            "numpy and python engines disagree"
+    print("  results agree")
+
+
+if __name__ == "__main__":
+    main()
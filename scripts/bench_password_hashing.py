@@ -0,0 +1,64 @@
+# scripts/bench_password_hashing.py
+"""
+Benchmark password hashing settings for PASSWORD_HASH_METHOD: time per
+login (check_password_hash on a stored hash) and logins/sec per core, plus
+the memory scrypt needs per concurrent login (128 * n * r bytes).
+
+A login costs one hash verification, so logins/sec per core is 1 / time.
+Multiply by the number of worker cores to size for a login storm.
+
+Usage:
+  python scripts/bench_password_hashing.py                        # built-in list
+  python scripts/bench_password_hashing.py scrypt:16384:8:1 pbkdf2:sha256:600000 [-n 5]
+"""
+import sys
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHODS = [
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',   # werkzeug default
+    'scrypt:65536:8:1',
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:1000000',  # werkzeug default for pbkdf2
+]
+
+
+def scrypt_memory(method):
+    parts = method.split(':')
+    if parts[0] != 'scrypt' or len(parts) < 3:
+        return None
+    return 128 * int(parts[1]) * int(parts[2])
+
+
+def bench(method, rounds):
+    stored = generate_password_hash('correct horse battery staple', method=method)
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        assert check_password_hash(stored, 'correct horse battery staple')
+        times.append(time.perf_counter() - t0)
+    return min(times), len(stored)
+
+
+def main():
+    args = sys.argv[1:]
+    rounds = 3
+    if '-n' in args:
+        i = args.index('-n')
+        rounds = int(args[i + 1])
+        del args[i:i + 2]
+    methods = args or DEFAULT_METHODS
+
+    print(f"best of {rounds} verifications per method, single core")
+    print(f"  {'method':<24} {'ms/login':>9} {'logins/s/core':>14} {'scrypt mem':>11} {'hash len':>9}")
+    for method in methods:
+        seconds, length = bench(method, rounds)
+        mem = scrypt_memory(method)
+        mem = f"{mem // (1024 * 1024)} MiB" if mem else '-'
+        print(f"  {method:<24} {seconds * 1000:>9.1f} {1 / seconds:>14.1f} {mem:>11} {length:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# scripts/bench_sqlite_concurrency.py
+"""
+Concurrency benchmark for the SQLite engine settings: N threads each run
+reserve -> release cycles through the real /user/reserve and /user/release
+views against a throwaway database, once with SQLite defaults ("before":
+rollback journal, no pragmas, SQLAlchemy's default pool) and once with
+Config.SQLALCHEMY_ENGINE_OPTIONS + SQLITE_PRAGMAS ("after").
+
+Reports reservations/sec (one reserve + one release each) and failed
+requests (e.g. "database is locked"). Redis is not used; the allocator
+falls back to its SQL claim path.
+
+Usage: python scripts/bench_sqlite_concurrency.py [threads] [cycles_per_thread]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 and not sys.argv[1].startswith('--') else 8
+CYCLES = int(sys.argv[2]) if len(sys.argv) > 2 and not sys.argv[2].startswith('--') else 50
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+MODES = {
+    'before': {'SQLITE_PRAGMAS': 'off', 'DB_POOL_SIZE': '5', 'DB_MAX_OVERFLOW': '10', 'DB_POOL_PRE_PING': '0'},
+    'after': {},
+}
+
+
+def run_mode():
+    """Child process: one benchmark run with the engine settings in the environment."""
+    import threading
+    import time
+    sys.path.insert(0, ROOT)
+    from server.app import create_app
+    from server.models import db
+    from server.models.user import User
+    from server.models.lot import ParkingLot
+    from server.controllers.auth import create_token
+    from server.controllers._lot_utils import bulk_add_spots
+
+    app = create_app()
+    app.redis = None
+    app.logger.setLevel('ERROR')
+    with app.app_context():
+        db.create_all()
+        lot = ParkingLot(name='bench', capacity=THREADS, price_per_hour=1.0,
+                         occupied_count=0, available_count=THREADS)
+        db.session.add(lot)
+        db.session.flush()
+        bulk_add_spots(lot.id, THREADS, start_number=0)
+        users = [User(username=f'bench{i}', email=f'bench{i}@x', password_hash='-') for i in range(THREADS)]
+        db.session.add_all(users)
+        db.session.commit()
+        lot_id = lot.id
+        tokens = [create_token(u) for u in users]
+
+    def call(path, token, body):
+        with app.test_request_context(path, method='POST', json=body,
+                                      headers={'Authorization': 'Bearer ' + token}):
+            resp = app.make_response(app.full_dispatch_request())
+            return resp.status_code, resp.get_json(silent=True) or {}
+
+    done, failed = [0], [0]
+    lock = threading.Lock()
+
+    def worker(token):
+        ok = bad = 0
+        for _ in range(CYCLES):
+            status, body = call('/user/reserve', token, {'lot_id': lot_id})
+            if status != 201:
+                bad += 1
+                continue
+            status, _ = call('/user/release', token, {'reservation_id': body['reservation']['id']})
+            if status != 200:
+                bad += 1
+                continue
+            ok += 1
+        with lock:
+            done[0] += ok
+            failed[0] += bad
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in tokens]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    print(f"{done[0]} {failed[0]} {elapsed:.3f}")
+
+
+def main():
+    print(f"{THREADS} threads x {CYCLES} reserve/release cycles")
+    for mode, env in MODES.items():
+        tmpdir = tempfile.mkdtemp(prefix="findmyspot-concurrency-")
+        child_env = dict(os.environ, **env)
+        child_env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+        out = subprocess.run([sys.executable, __file__, str(THREADS), str(CYCLES), '--child'],
+                             env=child_env, capture_output=True, text=True)
+        try:
+            done, failed, elapsed = out.stdout.strip().splitlines()[-1].split()
+        except Exception:
+            print(f"  {mode}: run failed\n{out.stderr[-2000:]}")
+            continue
+        print(f"  {mode:<7} {int(done) / float(elapsed):8.1f} reservations/s   "
+              f"{failed} failed requests   ({elapsed}s)")
+
+
+if __name__ == "__main__":
+    if '--child' in sys.argv:
+        run_mode()
+    else:
+        main()
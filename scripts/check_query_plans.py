@@ -0,0 +1,96 @@
+# scripts/check_query_plans.py
+"""
+Query-plan check for the hot reservation / spot queries.
+
+Builds a throwaway SQLite database from the models, runs EXPLAIN QUERY PLAN
+on each hot query and exits non-zero if any of them falls back to a full
+table scan (a "SCAN <table>" step that does not use an index).
+
+Usage: python scripts/check_query_plans.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+tmpdir = tempfile.mkdtemp(prefix="findmyspot-plans-")
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'plans.db')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import select, func, or_, and_
+from server.app import create_app
+from server.models import db
+from server.models.lot import ParkingLot
+from server.models.spot import ParkingSpot
+from server.models.reservation import Reservation
+
+NOW = datetime(2025, 1, 1)
+
+
+def hot_queries():
+    """(name, statement) pairs mirroring the request-path queries."""
+    enriched = select(Reservation, ParkingSpot, ParkingLot) \
+        .outerjoin(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+        .outerjoin(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+    return [
+        ("active reservation of user (reserve)",
+         select(Reservation).where(Reservation.user_id == 1, Reservation.end_time.is_(None)).limit(1)),
+        ("active reservation of spot (lot_spots)",
+         select(Reservation).where(Reservation.spot_id == 1, Reservation.end_time.is_(None))),
+        ("user history page (keyset)",
+         enriched.where(Reservation.user_id == 1,
+                        or_(Reservation.start_time < NOW,
+                            and_(Reservation.start_time == NOW, Reservation.id < 10)))
+         .order_by(Reservation.start_time.desc(), Reservation.id.desc()).limit(51)),
+        ("user month range (monthly report)",
+         select(Reservation).where(Reservation.user_id == 1,
+                                   Reservation.start_time >= NOW - timedelta(days=30),
+                                   Reservation.start_time <= NOW)),
+        ("recent reservations (analytics)",
+         select(Reservation).order_by(Reservation.start_time.desc()).limit(20)),
+        ("reservations per day (analytics)",
+         select(func.date(Reservation.start_time), func.count(Reservation.id))
+         .where(Reservation.start_time >= NOW - timedelta(days=30))
+         .group_by(func.date(Reservation.start_time))),
+        ("first free spot of lot (allocator)",
+         select(ParkingSpot.id).where(ParkingSpot.lot_id == 1, ParkingSpot.status == 'A')
+         .order_by(ParkingSpot.id).limit(1)),
+        ("spots of lot by status",
+         select(func.count(ParkingSpot.id)).where(ParkingSpot.lot_id == 1, ParkingSpot.status == 'O')),
+    ]
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = tuple(compiled.params[k] for k in compiled.positiontup)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    """Plan steps that scan a whole table without an index."""
+    return [step for step in plan if step.startswith("SCAN ") and "INDEX" not in step]
+
+
+def main():
+    app = create_app()
+    app.redis = None
+    failed = 0
+    with app.app_context():
+        db.create_all()
+        with db.engine.connect() as conn:
+            for name, stmt in hot_queries():
+                plan = explain(conn, stmt)
+                scans = full_scans(plan)
+                print(f"[{'FAIL' if scans else ' OK '}] {name}")
+                for step in plan:
+                    print(f"         {step}")
+                failed += bool(scans)
+    if failed:
+        print(f"{failed} hot quer{'y' if failed == 1 else 'ies'} fall back to a full table scan")
+        sys.exit(1)
+    print("all hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+# scripts/upgrade_db.py
+"""
+Bring an existing SQLite database up to the current models: create missing
+tables, add missing columns and indexes, then reseed the lot occupancy
+counters and rebuild the daily analytics rollups.
+
+Usage:
+  python scripts/upgrade_db.py                              # DATABASE_URL / Config default
+  python scripts/upgrade_db.py server/instance/parking.db   # a specific file
+"""
+import os
+import sys
+
+if len(sys.argv) > 1:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(sys.argv[1])
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.app import create_app
+from server.models import db
+from server.models.schema import upgrade_schema
+from server.controllers._lot_utils import reconcile_lot_counters
+from server.controllers._rollup_utils import rebuild_lot_rollups
+
+app = create_app()
+with app.app_context():
+    print("Upgrading", app.config['SQLALCHEMY_DATABASE_URI'])
+    db.create_all()
+    added = upgrade_schema()
+    print("Added:", ", ".join(added) if added else "nothing (already up to date)")
+    repaired = reconcile_lot_counters()
+    print("Lot counters repaired:", len(repaired))
+    print("Daily rollup rows rebuilt:", rebuild_lot_rollups())
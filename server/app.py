@@ -5,6 +5,12 @@ from .models.user import User
 from .models.lot import ParkingLot
 from .models.spot import ParkingSpot
 from .models.reservation import Reservation
+from .models.rollup import LotDailyRollup
+from .models.schema import upgrade_schema
+from .models.engine import init_engine
+from .utils.cache import init_cache
+from .controllers._lot_utils import reconcile_lot_counters
+from .controllers._rollup_utils import rebuild_lot_rollups
 from .controllers.auth import auth_bp
 from .controllers.admin import admin_bp
 from .controllers.user import user_bp
@@ -35,6 +41,7 @@ def create_app():
          expose_headers=["Content-Type", "Authorization"])
 
     db.init_app(app)
+    init_engine(app, db)
 
     try:
         import redis as _redis
@@ -54,6 +61,8 @@ def create_app():
         app.logger.exception("Failed to initialize Redis client: %s", e)
         print("[APP] Failed to initialize Redis:", e)
 
+    init_cache(app)
+
     # register blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(admin_bp, url_prefix='/admin')
@@ -108,6 +117,14 @@ if __name__ == '__main__':
     app = create_app()
     with app.app_context():
         db.create_all()
+        # bring older databases up to date (new columns/indexes) and seed the lot counters
+        added = upgrade_schema()
+        if added:
+            print('Schema upgraded, added:', ', '.join(added))
+            reconcile_lot_counters()
+        # backfill the analytics rollups the first time they exist
+        if not LotDailyRollup.query.first() and Reservation.query.first():
+            print('Daily rollups backfilled:', rebuild_lot_rollups())
         # create admin if not present (safe)
         if not User.query.filter_by(username='admin').first() and not User.query.filter_by(email='root@parking.local').first():
             try:
@@ -4,8 +4,47 @@ load_dotenv()
 
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
 
+def _engine_options(uri):
+    """Pool settings for SQLALCHEMY_ENGINE_OPTIONS; in-memory SQLite has a single-connection pool."""
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),  # seconds
+    }
+    if not (uri.startswith('sqlite') and (':memory:' in uri or uri.rstrip('/') in ('sqlite:', 'sqlite:/'))):
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 10))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+        options['pool_timeout'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    return options
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'devkey')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(BASEDIR, 'parking_new.db'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+    # applied to every new SQLite connection (see models/engine.py); set SQLITE_PRAGMAS=off to disable
+    SQLITE_PRAGMAS = {} if os.environ.get('SQLITE_PRAGMAS', '').lower() == 'off' else {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', 65536)),  # negative = KiB
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_BYTES', 268435456)),
+    }
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+    # optional per-process L1 cache in front of Redis (see utils/cache.py)
+    CACHE_L1_ENABLED = os.environ.get('CACHE_L1_ENABLED', '0').lower() in ('1', 'true', 'yes')
+    CACHE_L1_MAX_ITEMS = int(os.environ.get('CACHE_L1_MAX_ITEMS', 1024))
+    CACHE_L1_TTL = float(os.environ.get('CACHE_L1_TTL', 5))  # seconds
+
+    # cached value serialization (see utils/codecs.py); 'auto' = orjson + brotli when installed
+    CACHE_CODEC = os.environ.get('CACHE_CODEC', 'auto')
+    CACHE_COMPRESSION = os.environ.get('CACHE_COMPRESSION', 'auto')
+    CACHE_COMPRESS_MIN_BYTES = int(os.environ.get('CACHE_COMPRESS_MIN_BYTES', 1024))
+
+    # send cache invalidation (UNLINK/version bumps) after the response instead of before it
+    CACHE_DEFER_INVALIDATION = os.environ.get('CACHE_DEFER_INVALIDATION', '0').lower() in ('1', 'true', 'yes')
+
+    # password hashing, e.g. 'scrypt:32768:8:1' (n:r:p) or 'pbkdf2:sha256:600000';
+    # existing hashes are upgraded on the next login. Compare costs with
+    # scripts/bench_password_hashing.py before changing.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
@@ -1,7 +1,61 @@
 from functools import wraps
 from flask import request, jsonify, make_response
 import jwt, os
+from ..models import db
 from ..models.user import User
+from ..utils.cache import cache_get, cache_set
+
+# Verified users are cached per id as a small principal (id, role, username),
+# so token_required needs no database query on a hit; with the L1 cache on a
+# hit is an in-process lookup. admin_delete_user drops the entry.
+#
+# No endpoint changes a user's role or username, so nothing else invalidates
+# it: a role or username changed directly in the database takes effect within
+# PRINCIPAL_TTL seconds (deleting auth:user:<id> applies it at once). Code
+# that starts writing User.role or User.username must call
+# cache_delete(principal_key(user.id)) after its commit.
+PRINCIPAL_TTL = 60  # seconds
+
+def principal_key(user_id):
+    return f"auth:user:{user_id}"
+
+class UserPrincipal:
+    """
+    request.current_user: id, role and username come from the principal
+    cache; any other attribute (email, created_at, ...) loads the full User
+    row on first access.
+    """
+    __slots__ = ('id', 'role', 'username', '_user')
+
+    def __init__(self, id, role, username, user=None):
+        self.id = id
+        self.role = role
+        self.username = username
+        self._user = user
+
+    def _load(self):
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        user = self._load()
+        if user is None:
+            raise AttributeError(name)
+        return getattr(user, name)
+
+def _principal(user_id):
+    cached = cache_get(principal_key(user_id))
+    if cached is not None:
+        return UserPrincipal(**cached)
+    user = User.query.get(user_id)
+    if not user:
+        return None
+    cache_set(principal_key(user.id), {'id': user.id, 'role': user.role, 'username': user.username},
+              ttl=PRINCIPAL_TTL)
+    return UserPrincipal(user.id, user.role, user.username, user=user)
 
 def token_required(f):
     @wraps(f)
@@ -22,7 +76,7 @@ def token_required(f):
                 os.environ.get('SECRET_KEY', 'devkey'),
                 algorithms=['HS256']
             )
-            user = User.query.get(data['sub'])
+            user = _principal(data['sub'])
             if not user:
                 return jsonify({'error': 'invalid token'}), 401
             request.current_user = user
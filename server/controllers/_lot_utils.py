@@ -0,0 +1,242 @@
+# server/controllers/_lot_utils.py
+"""
+Lot occupancy helpers: maintained per-lot counters and the recount used to
+reconcile them, bulk spot generation/removal for capacity changes, and the
+write-through per-lot summary cache behind /api/lots/summary (whose writes
+are also broadcast to /api/lots/stream).
+
+Occupancy is counted in the database with one GROUP BY lot_id aggregate
+instead of loading every ParkingSpot row (and lazy-loading lot.spots per
+lot) and counting in Python.
+"""
+from sqlalchemy import func, case, cast, select, update, insert, delete, exists, Integer
+from ..models import db
+from ..models.lot import ParkingLot
+from ..models.spot import ParkingSpot
+from ..models.reservation import Reservation
+from ..utils.cache import cache_delete, cache_get_many, cache_set_if_newer, get_or_compute, seq_key
+from ..utils.lot_events import publish_lot_event
+
+
+def lot_occupancy(lot_id=None):
+    """
+    Return [(lot, total_spots, occupied), ...] ordered by lot id, from a
+    single statement. Lots without spots are included with zero counts.
+    Pass ``lot_id`` to restrict the result (and the aggregate) to one lot.
+    """
+    counts = db.session.query(
+        ParkingSpot.lot_id.label('lot_id'),
+        func.count(ParkingSpot.id).label('total'),
+        func.sum(case((ParkingSpot.status == 'O', 1), else_=0)).label('occupied')
+    )
+    if lot_id is not None:
+        counts = counts.filter(ParkingSpot.lot_id == lot_id)
+    counts = counts.group_by(ParkingSpot.lot_id).subquery()
+
+    q = db.session.query(
+        ParkingLot,
+        func.coalesce(counts.c.total, 0),
+        func.coalesce(counts.c.occupied, 0)
+    ).outerjoin(counts, counts.c.lot_id == ParkingLot.id)
+    if lot_id is not None:
+        q = q.filter(ParkingLot.id == lot_id)
+
+    return [(lot, int(total), int(occupied)) for lot, total, occupied in q.order_by(ParkingLot.id).all()]
+
+
+def adjust_lot_counters(lot, occupied=0, available=0):
+    """
+    Apply deltas to a lot's maintained occupancy counters inside the current
+    transaction. The new values are SQL expressions (col = col + delta), so
+    concurrent writers never overwrite each other's updates.
+    """
+    if occupied:
+        lot.occupied_count = ParkingLot.occupied_count + occupied
+    if available:
+        lot.available_count = ParkingLot.available_count + available
+    if occupied or available:
+        bump_lot_version(lot)
+
+
+def bump_lot_version(lot):
+    """Order this transaction's summary row after every earlier one (version = version + 1)."""
+    lot.version = ParkingLot.version + 1
+
+
+def flip_spot_status(spot_id, status):
+    """
+    Set a spot to ``status`` ('A' or 'O') with a conditional UPDATE ... WHERE
+    status = <the other one>, inside the current transaction. Returns True
+    only for the one writer that actually changed it, so concurrent callers
+    can't both apply the matching adjust_lot_counters delta.
+    """
+    other = 'O' if status == 'A' else 'A'
+    result = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id == spot_id, ParkingSpot.status == other)
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def reconcile_lot_counters(lot_id=None):
+    """
+    Recount spots per lot with the GROUP BY aggregate and repair any lot whose
+    maintained counters drifted. The repair itself is one UPDATE with
+    correlated subqueries, so a reservation committing meanwhile can't be
+    overwritten by a stale recount. Commits and returns the repaired lots as
+    [{'lot_id', 'occupied': (old, new), 'available': (old, new)}].
+    """
+    repaired = []
+    for lot, total, occupied in lot_occupancy(lot_id):
+        available = total - occupied
+        if lot.occupied_count != occupied or lot.available_count != available:
+            repaired.append({
+                'lot_id': lot.id,
+                'occupied': (lot.occupied_count, occupied),
+                'available': (lot.available_count, available)
+            })
+    if not repaired:
+        return repaired
+
+    def _count(status):
+        return select(func.count(ParkingSpot.id)) \
+            .where(ParkingSpot.lot_id == ParkingLot.id, ParkingSpot.status == status) \
+            .scalar_subquery()
+
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id.in_([r['lot_id'] for r in repaired]))
+        .values(occupied_count=_count('O'), available_count=_count('A'), version=ParkingLot.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return repaired
+
+
+def max_spot_number(lot_id):
+    """Highest numeric spot number of a lot (0 if none), computed in SQL."""
+    return db.session.query(func.max(cast(ParkingSpot.number, Integer))) \
+        .filter(ParkingSpot.lot_id == lot_id).scalar() or 0
+
+
+def bulk_add_spots(lot_id, count, start_number=None):
+    """
+    Insert ``count`` available spots numbered after ``start_number`` (default:
+    the lot's current max number) with one executemany INSERT, instead of
+    adding ParkingSpot objects one by one. Returns the number inserted.
+    """
+    if count <= 0:
+        return 0
+    if start_number is None:
+        start_number = max_spot_number(lot_id)
+    db.session.execute(
+        insert(ParkingSpot),
+        [{'lot_id': lot_id, 'number': str(start_number + i), 'status': 'A'} for i in range(1, count + 1)]
+    )
+    return count
+
+
+def bulk_remove_free_spots(lot_id, count):
+    """
+    Delete ``count`` available spots of a lot with a single DELETE ... WHERE
+    id IN (...), highest id first. Spots with reservation history are never
+    deleted, so history rows always point at an existing spot.
+    Returns the deleted ids, or None if the lot has fewer than ``count``
+    available spots without history (nothing is deleted then).
+    """
+    if count <= 0:
+        return []
+    has_history = exists().where(Reservation.spot_id == ParkingSpot.id)
+    ids = [row[0] for row in db.session.query(ParkingSpot.id)
+           .filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A', ~has_history)
+           .order_by(ParkingSpot.id.desc())
+           .limit(count).all()]
+    if len(ids) < count:
+        return None
+    db.session.execute(
+        delete(ParkingSpot).where(ParkingSpot.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    return ids
+
+
+# ---------------------------
+# Per-lot summary cache (write-through)
+# ---------------------------
+# Each lot's availability row lives in its own key, lot:{id}:summary. Writers
+# overwrite their lot's entry right after committing, so a reservation only
+# touches one lot's entry and the public listing stays warm under write
+# traffic. lots:index holds the ordered lot ids and only changes when a lot
+# is created or deleted.
+#
+# Rows carry the lot's version (bumped in every transaction that changes
+# them) and are stored with cache_set_if_newer, so a writer or reader whose
+# SELECT ran before a concurrent commit can't put back the older row; stream
+# clients drop older versions the same way.
+
+LOT_SUMMARY_TTL = 120  # seconds; write-through keeps entries fresh, TTL bounds any drift
+LOTS_INDEX_KEY = "lots:index"
+
+
+def lot_summary_key(lot_id):
+    return f"lot:{lot_id}:summary"
+
+
+def summary_row(lot):
+    """Availability row for one lot, built from the maintained counters."""
+    occupied = lot.occupied_count or 0
+    available = lot.available_count or 0
+    return {
+        'lot': lot.to_dict(),
+        'total_spots': occupied + available,
+        'occupied': occupied,
+        'available': available,
+        'version': lot.version or 0
+    }
+
+
+def cache_summary_rows(rows):
+    """Store {lot_id: summary_row} unless newer rows are cached; returns the lot ids written."""
+    written = cache_set_if_newer({lot_summary_key(i): (row['version'], row) for i, row in rows.items()},
+                                 ttl=LOT_SUMMARY_TTL)
+    return [i for i in rows if lot_summary_key(i) in written]
+
+
+def write_through_lot_summary(*lots):
+    """
+    Overwrite the cached summary entries of the given (committed) lots and
+    push the new rows to /api/lots/stream clients. Rows older than the
+    cached ones are neither stored nor pushed.
+    """
+    rows = {l.id: summary_row(l) for l in lots if l is not None}
+    publish_lot_event(rows[i] for i in cache_summary_rows(rows))
+
+
+def forget_lot_summary(lot_id):
+    """Drop a lot's entry, its version and the lot index (lot created or deleted)."""
+    cache_delete(lot_summary_key(lot_id), seq_key(lot_summary_key(lot_id)), LOTS_INDEX_KEY)
+
+
+def _lot_ids():
+    return [row[0] for row in db.session.query(ParkingLot.id).order_by(ParkingLot.id).all()]
+
+
+def cached_lots_summary():
+    """
+    Summary rows of all lots, ordered by id: lot index + one MGET of the
+    per-lot entries; only missing entries are read from the database (one
+    IN query). The index is filled single-flight, so an expired or dropped
+    index is rebuilt by one worker while the others keep the stale list.
+    """
+    lot_ids = get_or_compute(LOTS_INDEX_KEY, _lot_ids, ttl=LOT_SUMMARY_TTL)
+
+    rows = cache_get_many([lot_summary_key(i) for i in lot_ids])
+    missing = [i for i, row in zip(lot_ids, rows) if row is None]
+    if missing:
+        fresh = {l.id: summary_row(l) for l in ParkingLot.query.filter(ParkingLot.id.in_(missing)).all()}
+        cache_summary_rows(fresh)
+        rows = [row if row is not None else fresh.get(i) for i, row in zip(lot_ids, rows)]
+    # a lot deleted since the index was cached has no row: skip it
+    return [row for row in rows if row is not None]
@@ -0,0 +1,257 @@
+# server/controllers/_reservation_utils.py
+"""
+Shared reservation enrichment used by /user/reservations/<id>, /user/history,
+/admin/users/<id>/reservations and the admin recent-activity feed.
+
+Reservations are fetched joined to their spot and lot in one statement
+(instead of a ParkingSpot.query.get + ParkingLot.query.get per row) and
+serialized to a single dict shape that all three endpoints return.
+
+History is paged with a keyset cursor on (start_time, id), newest first,
+and the from/to/lot_id/active filters are applied in SQL.
+"""
+import base64
+import hashlib
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_
+from ..models import db
+from ..models.spot import ParkingSpot
+from ..models.reservation import Reservation
+from ..models.lot import ParkingLot
+from ..models.user import User
+
+
+def enriched_reservations_query():
+    """Query yielding (Reservation, ParkingSpot, ParkingLot) rows; spot/lot may be None."""
+    return db.session.query(Reservation, ParkingSpot, ParkingLot) \
+        .outerjoin(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+        .outerjoin(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+
+
+def serialize_reservation(r, spot, lot):
+    """
+    Canonical reservation dict returned to the frontend.
+    Carries both the flat (lot_id/lot_name/remarks) and nested (lot/notes)
+    fields that the different views historically consumed.
+    """
+    duration_seconds = None
+    try:
+        if r.start_time and r.end_time:
+            duration_seconds = int((r.end_time - r.start_time).total_seconds())
+    except Exception:
+        duration_seconds = None
+
+    notes = getattr(r, 'notes', None)
+    return {
+        'id': r.id,
+        'user_id': r.user_id,
+        'start_time': r.start_time.isoformat() if r.start_time else None,
+        'end_time': r.end_time.isoformat() if r.end_time else None,
+        'duration_seconds': duration_seconds,
+        'cost': getattr(r, 'cost', None),
+        'notes': notes,
+        'remarks': notes,
+
+        # spot info
+        'spot_id': r.spot_id,
+        'spot_number': getattr(spot, 'number', None),
+        'spot_status': getattr(spot, 'status', None),
+
+        # lot info (flat + nested)
+        'lot_id': getattr(lot, 'id', None),
+        'lot_name': getattr(lot, 'name', None),
+        'lot': {
+            'id': lot.id,
+            'name': lot.name,
+            'address': lot.address,
+            'price_per_hour': lot.price_per_hour
+        } if lot else None
+    }
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(start_time, reservation_id):
+    raw = f"{start_time.isoformat() if start_time else ''}|{reservation_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on malformed input."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        start_iso, rid = raw.split('|', 1)
+        return (datetime.fromisoformat(start_iso) if start_iso else None), int(rid)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def parse_when(value, end=False):
+    """
+    Parse an ISO date or datetime query arg into a naive UTC datetime, like
+    the stored columns (an explicit offset is converted to UTC). A bare date
+    used as an upper bound covers the whole day (returned as the next
+    midnight, exclusive).
+    """
+    try:
+        dt = datetime.fromisoformat(value)
+    except Exception:
+        raise ValueError(f'invalid date: {value}')
+    try:
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        if end and len(value) == 10:
+            dt += timedelta(days=1)
+    except OverflowError:
+        raise ValueError(f'date out of range: {value}')
+    return dt
+
+
+def parse_page_args(args):
+    """
+    Read limit/cursor/from/to/lot_id/active from request args into a
+    normalized dict. Raises ValueError with a client-facing message.
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except Exception:
+        raise ValueError('invalid limit')
+    if limit < 1:
+        raise ValueError('invalid limit')
+
+    lot_id = args.get('lot_id')
+    if lot_id not in (None, ''):
+        try:
+            lot_id = int(lot_id)
+        except Exception:
+            raise ValueError('invalid lot_id')
+    else:
+        lot_id = None
+
+    active = args.get('active')
+    if active not in (None, ''):
+        active = str(active).lower() in ('1', 'true', 'yes')
+    else:
+        active = None
+
+    cursor = args.get('cursor') or None
+    if cursor:
+        decode_cursor(cursor)  # validate early
+
+    return {
+        'limit': min(limit, MAX_PAGE_SIZE),
+        'cursor': cursor,
+        'from': parse_when(args['from']) if args.get('from') else None,
+        'to': parse_when(args['to'], end=True) if args.get('to') else None,
+        'lot_id': lot_id,
+        'active': active,
+    }
+
+
+def page_cache_part(page_args):
+    """Stable, short cache-key suffix identifying one page/filter combination."""
+    sig = "|".join(f"{k}={page_args[k]}" for k in sorted(page_args))
+    return hashlib.sha1(sig.encode('utf-8')).hexdigest()[:16]
+
+
+def user_reservations(user_id, limit=None, cursor=None, date_from=None, date_to=None, lot_id=None, active=None):
+    """
+    Reservations of a user (most recent first), enriched, in one query.
+
+    With ``limit`` set, returns at most that many rows after ``cursor`` and
+    the cursor of the next page (None when exhausted) as ``(rows, next_cursor)``.
+    Without ``limit`` the whole (filtered) history is returned as a list.
+    """
+    q = enriched_reservations_query().filter(Reservation.user_id == user_id)
+
+    if date_from is not None:
+        q = q.filter(Reservation.start_time >= date_from)
+    if date_to is not None:
+        q = q.filter(Reservation.start_time < date_to)
+    if lot_id is not None:
+        q = q.filter(ParkingSpot.lot_id == lot_id)
+    if active is True:
+        q = q.filter(Reservation.end_time.is_(None))
+    elif active is False:
+        q = q.filter(Reservation.end_time.isnot(None))
+
+    if cursor:
+        c_start, c_id = decode_cursor(cursor)
+        q = q.filter(or_(
+            Reservation.start_time < c_start,
+            and_(Reservation.start_time == c_start, Reservation.id < c_id)
+        ))
+
+    q = q.order_by(Reservation.start_time.desc(), Reservation.id.desc())
+
+    if limit is None:
+        return [serialize_reservation(r, spot, lot) for r, spot, lot in q.all()]
+
+    rows = q.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.start_time, last.id)
+    return [serialize_reservation(r, spot, lot) for r, spot, lot in rows], next_cursor
+
+
+def user_reservations_page(user_id, page_args):
+    """Run user_reservations() for parsed page args; returns the response body fragment."""
+    items, next_cursor = user_reservations(
+        user_id,
+        limit=page_args['limit'],
+        cursor=page_args['cursor'],
+        date_from=page_args['from'],
+        date_to=page_args['to'],
+        lot_id=page_args['lot_id'],
+        active=page_args['active'],
+    )
+    return {'reservations': items, 'next_cursor': next_cursor}
+
+
+def recent_reservations(limit, before=None, lot_id=None):
+    """
+    Most recent reservations across all users (admin activity feed) from one
+    Reservation/ParkingSpot/ParkingLot/User query, newest first, keyset-paged
+    like user_reservations. Returns ``(rows, next_cursor)``.
+    """
+    q = db.session.query(
+        Reservation.id, Reservation.start_time, Reservation.end_time, Reservation.cost, Reservation.notes,
+        ParkingSpot.number, ParkingLot.id, ParkingLot.name, User.id, User.username
+    ).outerjoin(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+     .outerjoin(ParkingLot, ParkingSpot.lot_id == ParkingLot.id) \
+     .outerjoin(User, Reservation.user_id == User.id)
+
+    if lot_id is not None:
+        q = q.filter(ParkingSpot.lot_id == lot_id)
+    if before:
+        c_start, c_id = decode_cursor(before)
+        q = q.filter(or_(
+            Reservation.start_time < c_start,
+            and_(Reservation.start_time == c_start, Reservation.id < c_id)
+        ))
+
+    rows = q.order_by(Reservation.start_time.desc(), Reservation.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+
+    return [{
+        'id': rid,
+        'user': {'id': user_id, 'username': username},
+        'lot': {'id': l_id, 'name': lot_name},
+        'spot_number': spot_number,
+        'start_time': start.isoformat() if start else None,
+        'end_time': end.isoformat() if end else None,
+        'cost': float(cost or 0.0),
+        'notes': notes
+    } for rid, start, end, cost, notes, spot_number, l_id, lot_name, user_id, username in rows], next_cursor
+
+
+def reservations_namespace(user_id):
+    """Cache namespace holding every cached history page of a user."""
+    return f"user:{user_id}:reservations"
@@ -0,0 +1,156 @@
+# server/controllers/_rollup_utils.py
+"""
+Daily per-lot rollups (models/rollup.LotDailyRollup).
+
+A reservation counts towards the lot and UTC day of its start_time:
+reserve() adds it to reservation_count, release() adds its cost to revenue
+and its duration to occupied_hours. The deltas are written with one upsert
+in the caller's transaction, so a rollup row changes exactly when the
+reservation does. rebuild_lot_rollups() recomputes a range of days from the
+reservation table to backfill or repair drift.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, text
+from ..models import db
+from ..models.rollup import LotDailyRollup
+from ..models.lot import ParkingLot
+from ..models.spot import ParkingSpot
+from ..models.reservation import Reservation
+
+ROLLUP_REBUILD_YIELD_PER = 5000
+
+
+def rollup_day(value):
+    """UTC day a reservation is attributed to (accepts datetime or date)."""
+    return value.date() if isinstance(value, datetime) else value
+
+
+def add_to_rollup(lot_id, day, count=0, revenue=0.0, hours=0.0):
+    """
+    Add deltas to the (lot_id, day) rollup row, creating it if needed.
+    Runs in the current session transaction; the caller commits.
+    """
+    if not lot_id or day is None or not (count or revenue or hours):
+        return
+    day = rollup_day(day)
+    values = {
+        'lot_id': lot_id,
+        'day': day,
+        'reservation_count': int(count),
+        'revenue': float(revenue),
+        'occupied_hours': float(hours),
+        'updated_at': datetime.utcnow(),
+    }
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = upsert(LotDailyRollup).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['lot_id', 'day'],
+            set_={
+                'reservation_count': LotDailyRollup.reservation_count + stmt.excluded.reservation_count,
+                'revenue': LotDailyRollup.revenue + stmt.excluded.revenue,
+                'occupied_hours': LotDailyRollup.occupied_hours + stmt.excluded.occupied_hours,
+                'updated_at': stmt.excluded.updated_at,
+            })
+        db.session.execute(stmt)
+        return
+
+    row = LotDailyRollup.query.filter_by(lot_id=lot_id, day=day).with_for_update().first()
+    if row is None:
+        db.session.add(LotDailyRollup(**values))
+    else:
+        row.reservation_count += values['reservation_count']
+        row.revenue += values['revenue']
+        row.occupied_hours += values['occupied_hours']
+
+
+def reservation_rollup_deltas(start_time, end_time, cost):
+    """(revenue, hours) a finished reservation contributes to its rollup row."""
+    hours = 0.0
+    if start_time and end_time:
+        hours = max(0.0, (end_time - start_time).total_seconds()) / 3600.0
+    return float(cost or 0.0), hours
+
+
+def _rollup_source():
+    """(lot_id, start_time, end_time, cost) of reservations, for aggregation."""
+    return db.session.query(ParkingSpot.lot_id, Reservation.start_time, Reservation.end_time, Reservation.cost) \
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+        .filter(Reservation.start_time.isnot(None))
+
+
+def _aggregate(rows):
+    """{(lot_id, day): [count, revenue, hours]} over _rollup_source rows."""
+    totals = {}
+    for lot_id, start, end, cost in rows:
+        row = totals.setdefault((lot_id, start.date()), [0, 0.0, 0.0])
+        revenue, hours = reservation_rollup_deltas(start, end, cost)
+        row[0] += 1
+        row[1] += revenue
+        row[2] += hours
+    return totals
+
+
+def remove_user_from_rollups(user_id):
+    """
+    Subtract a user's reservations from the rollups before they are deleted
+    (admin_delete_user). Runs in the current transaction; the caller commits.
+    """
+    q = _rollup_source().filter(Reservation.user_id == user_id)
+    for (l_id, day), (count, revenue, hours) in _aggregate(q).items():
+        add_to_rollup(l_id, day, count=-count, revenue=-revenue, hours=-hours)
+
+
+def rebuild_lot_rollups(since=None, until=None, lot_id=None):
+    """
+    Recompute the rollup rows for days in [since, until] (all days when
+    None), optionally for one lot, by streaming the matching reservations
+    once. Existing rows in the range are replaced, except those of deleted
+    lots, which can no longer be recomputed. Commits and returns the number
+    of rows written.
+
+    The write lock is taken before the reservations are read, so a
+    concurrent reserve/release either committed before the read (and is
+    counted) or waits and adds its delta on top of the rebuilt row.
+    """
+    since = rollup_day(since) if since else None
+    until = rollup_day(until) if until else None
+
+    # PostgreSQL: block rollup writers (not readers) until commit. Elsewhere
+    # the DELETE below takes the write lock (SQLite) or range locks (InnoDB).
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text(f"LOCK TABLE {LotDailyRollup.__tablename__} IN EXCLUSIVE MODE"))
+
+    stmt = delete(LotDailyRollup).where(LotDailyRollup.lot_id.in_(select(ParkingLot.id)))
+    if since:
+        stmt = stmt.where(LotDailyRollup.day >= since)
+    if until:
+        stmt = stmt.where(LotDailyRollup.day <= until)
+    if lot_id is not None:
+        stmt = stmt.where(LotDailyRollup.lot_id == lot_id)
+    db.session.execute(stmt)
+
+    q = _rollup_source()
+    if since:
+        q = q.filter(Reservation.start_time >= datetime.combine(since, datetime.min.time()))
+    if until:
+        q = q.filter(Reservation.start_time < datetime.combine(until + timedelta(days=1), datetime.min.time()))
+    if lot_id is not None:
+        q = q.filter(ParkingSpot.lot_id == lot_id)
+
+    totals = _aggregate(q.yield_per(ROLLUP_REBUILD_YIELD_PER))
+
+    now = datetime.utcnow()
+    rows = [{
+        'lot_id': l_id, 'day': day, 'reservation_count': count,
+        'revenue': revenue, 'occupied_hours': hours, 'updated_at': now
+    } for (l_id, day), (count, revenue, hours) in totals.items()]
+    if rows:
+        db.session.execute(LotDailyRollup.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
@@ -4,62 +4,19 @@ from ..models.lot import ParkingLot
 from ..models.spot import ParkingSpot
 from ..models.user import User
 from ..models.reservation import Reservation
-from ..utils.cache import cache_get, cache_set, cache_delete
-from ._auth_utils import token_required
-import json
+from ..utils.cache import cache_get, cache_set, cache_ns_key, cache_invalidate, cache_stats
+from ..utils.allocator import rebuild_free_spots, release_spot, remove_spots, drop_lot
+from ._auth_utils import token_required, principal_key
+from ._lot_utils import (adjust_lot_counters, bump_lot_version, flip_spot_status, bulk_add_spots,
+                         bulk_remove_free_spots, cached_lots_summary, write_through_lot_summary,
+                         forget_lot_summary)
+from ._reservation_utils import parse_page_args, page_cache_part, user_reservations_page, reservations_namespace
+from ._rollup_utils import remove_user_from_rollups
+from ..utils.lot_events import publish_lot_event
+from sqlalchemy import and_
 
 admin_bp = Blueprint('admin', __name__)
 
-# short TTL for cache (seconds)
-CACHE_TTL = 30
-
-def _cache_get(key):
-    r = getattr(current_app, 'redis', None)
-    if not r:
-        print(f"[CACHE] redis not configured; skip GET {key}")
-        return None
-    try:
-        val = r.get(key)
-        if val is None:
-            current_app.logger.info("Cache MISS for key=%s", key)
-            print(f"[CACHE] MISS {key}")
-            return None
-        current_app.logger.info("Cache HIT for key=%s", key)
-        print(f"[CACHE] HIT {key}")
-        return json.loads(val)
-    except Exception as e:
-        current_app.logger.info("Redis get error for key=%s: %s", key, e)
-        print(f"[CACHE] GET ERROR {key}: {e}")
-        return None
-
-def _cache_set(key, value, ttl=CACHE_TTL):
-    r = getattr(current_app, 'redis', None)
-    if not r:
-        print(f"[CACHE] redis not configured; skip SET {key}")
-        return
-    try:
-        r.set(key, json.dumps(value), ex=ttl)
-        current_app.logger.info("Cache SET for key=%s (ttl=%s)", key, ttl)
-        print(f"[CACHE] SET {key} ttl={ttl}")
-    except Exception as e:
-        current_app.logger.info("Redis set error for key=%s: %s", key, e)
-        print(f"[CACHE] SET ERROR {key}: {e}")
-
-def _cache_delete(*keys):
-    r = getattr(current_app, 'redis', None)
-    if not r:
-        print(f"[CACHE] redis not configured; skip DEL {keys}")
-        return
-    try:
-        for k in keys:
-            r.delete(k)
-            current_app.logger.info("Cache DEL key=%s", k)
-            print(f"[CACHE] DEL {k}")
-    except Exception as e:
-        current_app.logger.info("Redis del error: %s", e)
-        print(f"[CACHE] DEL ERROR: {e}")
-
-
 @admin_bp.route('/lots', methods=['POST'])
 @token_required
 def create_lot():
@@ -73,18 +30,22 @@ def create_lot():
     capacity = int(data.get('capacity', 0))
     price = float(data.get('price_per_hour', 0))
 
-    lot = ParkingLot(name=name, address=address, capacity=capacity, price_per_hour=price)
+    lot = ParkingLot(name=name, address=address, capacity=capacity, price_per_hour=price,
+                     occupied_count=0, available_count=capacity)
     db.session.add(lot)
     db.session.flush()
 
-    for i in range(1, capacity + 1):
-        spot = ParkingSpot(lot_id=lot.id, number=str(i), status='A')
-        db.session.add(spot)
+    # one executemany INSERT for all spots
+    bulk_add_spots(lot.id, capacity, start_number=0)
 
     db.session.commit()
 
-    # invalidate lots summary cache
-    _cache_delete("lots:summary")
+    # seed the allocator's free set for the new lot
+    rebuild_free_spots(lot.id)
+
+    # new lot: seed its summary entry and drop the cached lot index
+    forget_lot_summary(lot.id)
+    write_through_lot_summary(lot)
 
     return jsonify({'lot': lot.to_dict()}), 201
 
@@ -96,15 +57,17 @@ def delete_lot(lot_id):
         return jsonify({'error': 'forbidden'}), 403
 
     lot = ParkingLot.query.get_or_404(lot_id)
-    occupied = any(s.status == 'O' for s in lot.spots)
-    if occupied:
+    if (lot.occupied_count or 0) > 0:
         return jsonify({'error': 'cannot delete: some spots are occupied'}), 400
 
     db.session.delete(lot)
     db.session.commit()
+    drop_lot(lot_id)
 
     # invalidate caches
-    _cache_delete("lots:summary", f"lot:{lot_id}:spots")
+    forget_lot_summary(lot_id)
+    cache_invalidate(keys=[f"lot:{lot_id}:spots"], namespaces=["analytics"])
+    publish_lot_event(deleted=[lot_id])
 
     return jsonify({'message': 'deleted'}), 200
 
@@ -115,14 +78,8 @@ def list_lots():
     if user.role != 'admin':
         return jsonify({'error': 'forbidden'}), 403
 
-    cache_key = "lots:summary"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return jsonify({'lots': cached})
-
-    lots = ParkingLot.query.all()
-    payload = [l.to_dict() for l in lots]
-    cache_set(cache_key, payload)
+    # served from the same per-lot summary entries as /api/lots/summary
+    payload = [row['lot'] for row in cached_lots_summary()]
     return jsonify({'lots': payload})
 
 
@@ -160,42 +117,36 @@ def edit_lot(lot_id):
         if new_capacity == old_capacity:
             pass
         elif new_capacity > old_capacity:
-            max_number = 0
-            if lot.spots:
-                try:
-                    nums = [int(s.number) for s in lot.spots if str(s.number).isdigit()]
-                    max_number = max(nums) if nums else 0
-                except:
-                    max_number = len(lot.spots)
+            # new spots are numbered after MAX(CAST(number AS INTEGER)), bulk inserted
             to_add = new_capacity - old_capacity
-            for i in range(1, to_add + 1):
-                sp = ParkingSpot(lot_id=lot.id, number=str(max_number + i), status='A')
-                db.session.add(sp)
+            bulk_add_spots(lot.id, to_add)
+            adjust_lot_counters(lot, available=to_add)
             lot.capacity = new_capacity
         else:
+            # single DELETE ... WHERE id IN (...) over free spots
             to_remove = old_capacity - new_capacity
-            avail_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='A').order_by(ParkingSpot.id.desc()).limit(to_remove).all()
-            if len(avail_spots) < to_remove:
-                return jsonify({'error': 'cannot decrease capacity: not enough available (free) spots to delete'}), 400
-            for sp in avail_spots:
-                db.session.delete(sp)
+            if bulk_remove_free_spots(lot.id, to_remove) is None:
+                return jsonify({'error': 'cannot decrease capacity: not enough available (free) spots without reservation history to delete'}), 400
+            adjust_lot_counters(lot, available=-to_remove)
             lot.capacity = new_capacity
 
+    # name/address/price changes alter the summary row too
+    bump_lot_version(lot)
     db.session.commit()
 
-    # invalidate caches for lots summary and this lot's spots
-    _cache_delete("lots:summary", f"lot:{lot_id}:spots")
+    # spots were added or removed: resync the allocator's free set
+    if 'capacity' in data:
+        rebuild_free_spots(lot.id)
+
+    # refresh this lot's summary entry and drop its spot listing
+    write_through_lot_summary(lot)
+    cache_invalidate(keys=[f"lot:{lot_id}:spots"], namespaces=["analytics"])
 
     return jsonify({'success': True, 'lot': lot.to_dict()})
 
 @admin_bp.route('/lots/<int:lot_id>/spots', methods=['GET'])
 @token_required
 def lot_spots(lot_id):
-    cache_key = f"lot:{lot_id}:spots"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return jsonify({'spots': cached, 'lot': {'id': lot.id, 'name': lot.name, 'capacity': lot.capacity, 'price_per_hour': lot.price_per_hour}})
-
     """
     Returns spots for a lot with enriched current reservation metadata:
     - reservation_id
@@ -205,6 +156,10 @@ def lot_spots(lot_id):
     - duration_seconds (int or None)
     - cost (if ended) or estimated_cost (if active)
     - notes
+
+    Spots, their active reservations and the reserving users come from one
+    LEFT JOIN query; durations and estimated costs are computed in a single
+    pass. The whole payload (spots + lot) is cached.
     """
     try:
         from datetime import datetime
@@ -214,66 +169,64 @@ def lot_spots(lot_id):
         if user.role != 'admin':
             return jsonify({'error': 'forbidden'}), 403
 
+        cache_key = f"lot:{lot_id}:spots"
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
         lot = ParkingLot.query.get(lot_id)
         if not lot:
             return jsonify({'error': 'lot not found'}), 404
 
-        spots = ParkingSpot.query.filter_by(lot_id=lot.id).order_by(ParkingSpot.number.asc()).all()
+        rows = db.session.query(ParkingSpot, Reservation, User) \
+            .outerjoin(Reservation, and_(Reservation.spot_id == ParkingSpot.id, Reservation.end_time.is_(None))) \
+            .outerjoin(User, User.id == Reservation.user_id) \
+            .filter(ParkingSpot.lot_id == lot.id) \
+            .order_by(ParkingSpot.number.asc(), Reservation.start_time.asc()) \
+            .all()
+
+        now = datetime.utcnow()
+        price = float(getattr(lot, 'price_per_hour', 0) or 0)
         out = []
-        for s in spots:
-            item = {'id': s.id, 'number': s.number, 'status': s.status}
-            if s.status == 'O':
-                # find the active reservation (end_time is None) or most recent reservation
-                res = Reservation.query.filter_by(spot_id=s.id).order_by(Reservation.start_time.desc()).first()
-                # prefer the reservation that's currently active (end_time is None)
-                if res and res.end_time is not None:
-                    # try to find a truly active one
-                    active = Reservation.query.filter_by(spot_id=s.id, end_time=None).order_by(Reservation.start_time.desc()).first()
-                    if active:
-                        res = active
-
-                if res:
-                    # user info
-                    u = User.query.get(res.user_id) if res.user_id else None
-
-                    # compute duration and cost
-                    duration_seconds = None
-                    est_cost = None
-                    final_cost = getattr(res, 'cost', None)
-                    try:
-                        if res.start_time and res.end_time:
-                            duration_seconds = int((res.end_time - res.start_time).total_seconds())
-                        elif res.start_time and not res.end_time:
-                            duration_seconds = int((datetime.utcnow() - res.start_time).total_seconds())
-                    except Exception:
-                        duration_seconds = None
-
-                    # compute estimated cost for active reservation if lot price is available
-                    try:
-                        if res.end_time is None:
-                            # ceil to hours
-                            hrs = math.ceil((duration_seconds or 0) / 3600.0)
-                            price = float(getattr(lot, 'price_per_hour', 0) or 0)
-                            est_cost = hrs * price
-                    except Exception:
-                        est_cost = None
-
-                    item['current_reservation'] = {
-                        'reservation_id': res.id,
-                        'user': {'id': u.id, 'username': u.username, 'email': u.email} if u else None,
-                        'start_time': res.start_time.isoformat() if res.start_time else None,
-                        'end_time': res.end_time.isoformat() if res.end_time else None,
-                        'duration_seconds': duration_seconds,
-                        # if reservation ended, return recorded cost; otherwise return estimated cost
-                        'cost': final_cost if (res.end_time is not None and final_cost is not None) else None,
-                        'estimated_cost': est_cost,
-                        'notes': getattr(res, 'notes', None)
-                    }
-
-            out.append(item)
-
-        cache_set(cache_key, out)
-        return jsonify({'spots': out, 'lot': {'id': lot.id, 'name': lot.name, 'capacity': lot.capacity, 'price_per_hour': lot.price_per_hour}})
+        by_spot = {}
+        for s, res, u in rows:
+            item = by_spot.get(s.id)
+            if item is None:
+                item = {'id': s.id, 'number': s.number, 'status': s.status}
+                by_spot[s.id] = item
+                out.append(item)
+
+            # only occupied spots carry reservation details; if a spot somehow has
+            # several active reservations the latest one (last row) wins
+            if s.status != 'O' or res is None:
+                continue
+
+            duration_seconds = None
+            est_cost = None
+            try:
+                if res.start_time:
+                    duration_seconds = int((now - res.start_time).total_seconds())
+                    # ceil to hours
+                    est_cost = math.ceil((duration_seconds or 0) / 3600.0) * price
+            except Exception:
+                duration_seconds = None
+                est_cost = None
+
+            item['current_reservation'] = {
+                'reservation_id': res.id,
+                'user': {'id': u.id, 'username': u.username, 'email': u.email} if u else None,
+                'start_time': res.start_time.isoformat() if res.start_time else None,
+                'end_time': None,
+                'duration_seconds': duration_seconds,
+                # active reservation: no recorded cost yet, return estimated cost
+                'cost': None,
+                'estimated_cost': est_cost,
+                'notes': getattr(res, 'notes', None)
+            }
+
+        payload = {'spots': out, 'lot': {'id': lot.id, 'name': lot.name, 'capacity': lot.capacity, 'price_per_hour': lot.price_per_hour}}
+        cache_set(cache_key, payload)
+        return jsonify(payload)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -305,6 +258,16 @@ def admin_list_users():
     return jsonify({'users': out})
 
 
+@admin_bp.route('/cache/stats', methods=['GET'])
+@token_required
+def cache_stats_view():
+    """Hit/miss counters per cache tier for the worker serving this request."""
+    user = getattr(request, 'current_user')
+    if user.role != 'admin':
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify(cache_stats())
+
+
 @admin_bp.route('/users/<int:user_id>', methods=['DELETE'])
 @token_required
 def admin_delete_user(user_id):
@@ -341,6 +304,7 @@ def admin_delete_user(user_id):
 
         # delete user's reservations/history first (if you prefer to keep history, skip this)
         try:
+            remove_user_from_rollups(user_id)
             Reservation.query.filter_by(user_id=user_id).delete()
         except Exception:
             # ignore - we'll still attempt to delete user record
@@ -349,9 +313,10 @@ def admin_delete_user(user_id):
         db.session.delete(target)
         db.session.commit()
 
-        # invalidate any caches that may include user data (optional)
+        # invalidate any caches that may include user data
         try:
-            _cache_delete("lots:summary")
+            cache_invalidate(keys=["users:list", principal_key(user_id)],
+                             namespaces=["analytics", reservations_namespace(user_id)])
         except Exception:
             pass
 
@@ -367,8 +332,9 @@ def admin_delete_user(user_id):
 @token_required
 def admin_user_reservations(user_id):
     """
-    Return all reservations for a specific user.
+    Return reservations for a specific user, one page at a time.
     Enriched with spot and lot details, duration (seconds), cost and notes.
+    Accepts the same paging/filter args as /user/reservations/<id>.
     Admin-only endpoint.
     """
     try:
@@ -381,47 +347,19 @@ def admin_user_reservations(user_id):
         if not target_user:
             return jsonify({'error': 'user not found'}), 404
 
-        # fetch reservations (most recent first)
-        resv_q = Reservation.query.filter_by(user_id=user_id).order_by(Reservation.start_time.desc()).all()
-
-        out = []
-        for r in resv_q:
-            # get spot and lot (may be None)
-            spot = ParkingSpot.query.get(r.spot_id) if r.spot_id else None
-            lot = ParkingLot.query.get(spot.lot_id) if (spot and getattr(spot, "lot_id", None)) else None
-
-            # compute duration_seconds if both timestamps present
-            duration_seconds = None
-            try:
-                if r.start_time and r.end_time:
-                    duration_seconds = int((r.end_time - r.start_time).total_seconds())
-            except Exception:
-                duration_seconds = None
-
-            out.append({
-                'id': r.id,
-                'user_id': r.user_id,
-                'start_time': r.start_time.isoformat() if r.start_time else None,
-                'end_time': r.end_time.isoformat() if r.end_time else None,
-                'duration_seconds': duration_seconds,
-                'cost': getattr(r, 'cost', None),
-                'notes': getattr(r, 'notes', None),
-
-                # spot info
-                'spot_id': getattr(spot, 'id', None),
-                'spot_number': getattr(spot, 'number', None),
-                'spot_status': getattr(spot, 'status', None),
-
-                # lot info (nested)
-                'lot': {
-                    'id': getattr(lot, 'id', None),
-                    'name': getattr(lot, 'name', None),
-                    'address': getattr(lot, 'address', None),
-                    'price_per_hour': getattr(lot, 'price_per_hour', None)
-                } if lot else None
-            })
-
-        return jsonify({'user': {'id': target_user.id, 'username': target_user.username, 'email': target_user.email}, 'reservations': out}), 200
+        try:
+            page_args = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # fetch one page of reservations (most recent first), joined to spot and lot
+        cache_key = cache_ns_key(reservations_namespace(user_id), page_cache_part(page_args))
+        page = cache_get(cache_key)
+        if page is None:
+            page = user_reservations_page(user_id, page_args)
+            cache_set(cache_key, page)
+
+        return jsonify({'user': {'id': target_user.id, 'username': target_user.username, 'email': target_user.email}, **page}), 200
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -437,15 +375,26 @@ def edit_spot(lot_id, spot_id):
         return jsonify({'error': 'forbidden'}), 403
     data = request.get_json() or {}
     sp = ParkingSpot.query.filter_by(id=spot_id, lot_id=lot_id).first_or_404()
-    if 'status' in data:
-        if data['status'] in ('A','O'):
-            sp.status = data['status']
     if 'number' in data:
         sp.number = str(data['number'])
+    # conditional flip: only the request that changes the status moves the counters
+    new_status = data.get('status')
+    changed = new_status in ('A', 'O') and new_status != sp.status and flip_spot_status(sp.id, new_status)
+    if changed:
+        delta = 1 if new_status == 'O' else -1
+        adjust_lot_counters(sp.lot, occupied=delta, available=-delta)
     db.session.commit()
 
-    # invalidate cache for this lot's spots
-    _cache_delete("lots:summary", f"lot:{lot_id}:spots")
+    # keep the allocator's free set in step with manual status changes
+    if changed:
+        if new_status == 'A':
+            release_spot(lot_id, sp.id)
+        else:
+            remove_spots(lot_id, sp.id)
+
+    # refresh this lot's summary entry and drop its spot listing
+    write_through_lot_summary(sp.lot)
+    cache_invalidate(keys=[f"lot:{lot_id}:spots"], namespaces=["analytics"])
 
     return jsonify({'spot': sp.to_dict()})
 
@@ -472,7 +421,8 @@ def generate_monthly_reports_now():
         return jsonify({'error': 'tasks_unavailable', 'message': str(e)}), 500
 
     try:
-        job = enqueue_monthly_reports.delay()
+        # manual trigger: always a full run, never a resume of the scheduled one
+        job = enqueue_monthly_reports.delay(resume=False)
     except Exception as e:
         current_app.logger.exception("Failed to enqueue monthly reports: %s", e)
         return jsonify({'error': 'enqueue_failed', 'message': str(e)}), 500
@@ -1,120 +1,454 @@
 # server/controllers/analytics.py
 from flask import Blueprint, jsonify, request, current_app
-from ..utils.cache import cache_get, cache_set, cache_delete
+from ..utils.cache import cache_ns_key, get_or_compute, cache_get_many, cache_set_many
+from ..utils.occupancy import occupied_seconds, hour_of_week_utilization, HOUR
 from ._auth_utils import token_required
+from ._reservation_utils import parse_when, decode_cursor, recent_reservations
+from ._rollup_utils import reservation_rollup_deltas
 from ..models.lot import ParkingLot
 from ..models.spot import ParkingSpot
 from ..models.reservation import Reservation
-from ..models.user import User
+from ..models.rollup import LotDailyRollup
 from ..models import db
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, or_
 
 analytics_bp = Blueprint('analytics', __name__)
 
+ANALYTICS_TTL = 60  # seconds
+
+SECTIONS = ('revenue', 'occupancy', 'reservations', 'recent')
+GRANULARITIES = ('hour', 'day', 'week')
+DEFAULT_DAYS = 30
+MAX_SERIES_BUCKETS = 24 * 31  # 31 days hourly, ~2 years daily, ~14 years weekly
+RECENT_LIMIT = 20
+MAX_RECENT_LIMIT = 100
+
+# occupancy matrices change only as reservations age into the window, so
+# they are cached per lot and window for a few minutes rather than being
+# invalidated by every reserve/release
+OCCUPANCY_TTL = 300  # seconds
+DEFAULT_OCCUPANCY_DAYS = 28
+MAX_OCCUPANCY_DAYS = 366
+
 @analytics_bp.route('/summary', methods=['GET'])
 @token_required
 def analytics_summary():
     """
-    Admin-only analytics summary:
-    - total_revenue (sum of Reservation.cost)
-    - revenue_per_lot: list of {lot_id, lot_name, revenue}
+    Admin-only analytics summary. Query args (all optional):
+    - from / to: ISO date or datetime window, UTC unless an offset is given
+      (default: the last 30 days)
+    - granularity: hour | day | week bucket size of the reservation series
+      (default day; at most MAX_SERIES_BUCKETS buckets)
+    - lot_id: restrict every section to one lot
+    - sections: comma list of revenue, occupancy, reservations, recent (default all)
+    - limit / before: page size (default 20, max 100) and keyset cursor of the recent feed
+
+    Sections:
+    - revenue: total_revenue and revenue_per_lot [{lot_id, lot_name, revenue, occupied_hours}]
+      of the reservations started in the window (all time unless from/to is given)
     - occupancy: per-lot occupancy (occupied, total)
-    - reservations_last_30_days: list of {date, count}
-    - recent_reservations: last 20 reservations (enriched)
+    - reservations: reservations_series [{bucket, count, revenue}]; without
+      from/to/granularity also reservations_last_30_days [{date, count}]
+    - recent: recent_reservations, the last ``limit`` reservations (enriched), and
+      recent_next_cursor to pass as ``before`` for the next page; scroll the
+      feed with ``?sections=recent&before=...``
     """
-    cache_key = "analytics:summary"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return jsonify(cached)
-
     user = getattr(request, 'current_user', None)
     if not user or user.role != 'admin':
         return jsonify({'error': 'forbidden'}), 403
 
     try:
-        now = datetime.utcnow()
-        days = 30
-        start_date = (now - timedelta(days=days-1)).replace(hour=0, minute=0, second=0, microsecond=0)
-
-        # total revenue (only include reservations with non-null cost)
-        total_revenue = db.session.query(func.coalesce(func.sum(Reservation.cost), 0.0)).scalar() or 0.0
-
-        # revenue per lot: join reservations -> spots -> lots
-        rev_q = db.session.query(
-            ParkingLot.id.label('lot_id'),
-            ParkingLot.name.label('lot_name'),
-            func.coalesce(func.sum(Reservation.cost), 0.0).label('revenue')
-        ).join(ParkingSpot, ParkingSpot.lot_id == ParkingLot.id) \
-         .join(Reservation, Reservation.spot_id == ParkingSpot.id) \
-         .group_by(ParkingLot.id).order_by(func.coalesce(func.sum(Reservation.cost), 0.0).desc())
-
-        revenue_per_lot = []
-        for r in rev_q:
-            revenue_per_lot.append({
-                'lot_id': r.lot_id,
-                'lot_name': r.lot_name,
-                'revenue': float(r.revenue or 0.0)
-            })
-
-        # occupancy per lot (current)
-        lots = ParkingLot.query.all()
-        occupancy = []
-        for l in lots:
-            total = len(l.spots)
-            occupied = sum(1 for s in l.spots if s.status == 'O')
-            occupancy.append({
-                'lot_id': l.id,
-                'lot_name': l.name,
-                'total_spots': total,
-                'occupied': occupied,
-                'available': total - occupied
-            })
-
-        # reservations per day in last N days
-        daily_counts = []
-        # group by date (UTC) using SQL function
-        day_counts_q = db.session.query(
-            func.date(Reservation.start_time).label('d'),
-            func.count(Reservation.id).label('cnt')
-        ).filter(Reservation.start_time >= start_date) \
-         .group_by(func.date(Reservation.start_time)).all()
-
-        # map date -> count
-        day_map = {str(row.d): int(row.cnt) for row in day_counts_q}
-
-        for i in range(days):
-            d = (start_date + timedelta(days=i)).date()
-            daily_counts.append({'date': d.isoformat(), 'count': int(day_map.get(d.isoformat(), 0))})
-
-        # recent reservations (last 20, enriched)
-        recent_q = Reservation.query.order_by(Reservation.start_time.desc()).limit(20).all()
-        recent = []
-        for r in recent_q:
-            spot = ParkingSpot.query.get(r.spot_id) if r.spot_id else None
-            lot = ParkingLot.query.get(spot.lot_id) if spot and getattr(spot, 'lot_id', None) else None
-            user_obj = User.query.get(r.user_id)
-            recent.append({
-                'id': r.id,
-                'user': {'id': getattr(user_obj, 'id', None), 'username': getattr(user_obj, 'username', None)},
-                'lot': {'id': getattr(lot, 'id', None), 'name': getattr(lot, 'name', None)},
-                'spot_number': getattr(spot, 'number', None),
-                'start_time': r.start_time.isoformat() if r.start_time else None,
-                'end_time': r.end_time.isoformat() if r.end_time else None,
-                'cost': float(r.cost or 0.0),
-                'notes': getattr(r, 'notes', None)
-            })
-
-        payload = {
-            'total_revenue': float(total_revenue),
-            'revenue_per_lot': revenue_per_lot,
-            'occupancy': occupancy,
-            'reservations_last_30_days': daily_counts,
-            'recent_reservations': recent
-        }
+        params = parse_summary_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        cache_set(cache_key, payload, ttl=60)
+    try:
+        payload = {'params': {
+            'from': params['from'].isoformat(),
+            'to': params['to'].isoformat(),
+            'granularity': params['granularity'],
+            'lot_id': params['lot_id'],
+            'sections': list(params['sections']),
+        }}
+        # each section is cached on its own, keyed by only the params it
+        # depends on, so widgets asking for different combinations share
+        # entries. Versioned keys: writers invalidate with an O(1) bump of
+        # the "analytics" namespace; one worker recomputes on expiry/bump and
+        # the rest get the previous value meanwhile.
+        for section in params['sections']:
+            part = _section_cache_part(section, params)
+            payload.update(get_or_compute(cache_ns_key("analytics", f"summary:{part}"),
+                                          lambda build=_SECTION_BUILDERS[section]: build(params),
+                                          ttl=ANALYTICS_TTL, stale_key=f"analytics:summary:last:{part}"))
         return jsonify(payload)
     except Exception as e:
         current_app.logger.exception("Analytics error: %s", e)
         return jsonify({'error': 'internal', 'message': str(e)}), 500
+
+
+@analytics_bp.route('/occupancy', methods=['GET'])
+@token_required
+def occupancy_matrix():
+    """
+    Admin-only hourly occupancy per lot as a lot x hour-of-week matrix.
+    Query args (optional): from / to (ISO date or datetime, UTC unless an
+    offset is given, hour-aligned; default the last 28 days up to the
+    current hour, max 366 days), lot_id.
+
+    Each lot gets ``utilization``: 7 rows (Monday first) x 24 hours of mean
+    occupied spot-hours / (capacity x hours observed), None for hours of the
+    week outside the window. Capacity is the lot's current spot count.
+    """
+    user = getattr(request, 'current_user', None)
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'forbidden'}), 403
+
+    now = datetime.utcnow()
+    try:
+        date_from, date_to, lot_id = parse_occupancy_args(request.args, now)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        lots_q = ParkingLot.query
+        if lot_id is not None:
+            lots_q = lots_q.filter(ParkingLot.id == lot_id)
+        lots = lots_q.order_by(ParkingLot.id).all()
+
+        window = f"{date_from:%Y%m%dT%H}-{date_to:%Y%m%dT%H}"
+        keys = [_occupancy_key(l.id, window) for l in lots]
+        cached = cache_get_many(keys)
+        missing = [l for l, hit in zip(lots, cached) if hit is None]
+        computed = _occupancy_matrices(missing, date_from, date_to, now) if missing else {}
+        if computed:
+            cache_set_many({_occupancy_key(l_id, window): m for l_id, m in computed.items()},
+                           ttl=OCCUPANCY_TTL)
+
+        return jsonify({
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat(),
+            'rows': 'weekday (0 = Monday)',
+            'columns': 'hour of day (UTC)',
+            'lots': [hit if hit is not None else computed[l.id] for l, hit in zip(lots, cached)],
+        })
+    except Exception as e:
+        current_app.logger.exception("Occupancy analytics error: %s", e)
+        return jsonify({'error': 'internal', 'message': str(e)}), 500
+
+
+def _occupancy_key(lot_id, window):
+    return f"analytics:occupancy:{lot_id}:{window}"
+
+
+def parse_occupancy_args(args, now):
+    """
+    (from, to, lot_id) of the occupancy query as naive UTC datetimes,
+    hour-aligned (see parse_when). Raises ValueError.
+    """
+    date_to = parse_when(args['to'], end=True) if args.get('to') else _bucket_start(now, 'hour')
+    try:
+        date_from = parse_when(args['from']) if args.get('from') else date_to - timedelta(days=DEFAULT_OCCUPANCY_DAYS)
+        date_from = _bucket_start(date_from, 'hour')
+        if _bucket_start(date_to, 'hour') != date_to:
+            date_to = _bucket_start(date_to, 'hour') + timedelta(hours=1)
+    except OverflowError:
+        raise ValueError('date out of range')
+    if date_from >= date_to:
+        raise ValueError('from must be before to')
+    if date_to - date_from > timedelta(days=MAX_OCCUPANCY_DAYS):
+        raise ValueError(f'window is limited to {MAX_OCCUPANCY_DAYS} days')
+
+    lot_id = args.get('lot_id')
+    if lot_id not in (None, ''):
+        try:
+            lot_id = int(lot_id)
+        except Exception:
+            raise ValueError('invalid lot_id')
+    else:
+        lot_id = None
+    return date_from, date_to, lot_id
+
+
+def _occupancy_matrices(lots, date_from, date_to, now):
+    """
+    {lot_id: {lot_id, lot_name, capacity, utilization}} for ``lots`` from one
+    query of the reservation intervals overlapping the window.
+    """
+    intervals = {l.id: [] for l in lots}
+    q = db.session.query(ParkingSpot.lot_id, Reservation.start_time, Reservation.end_time) \
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+        .filter(ParkingSpot.lot_id.in_(list(intervals)),
+                Reservation.start_time < date_to,
+                or_(Reservation.end_time.is_(None), Reservation.end_time > date_from))
+    for l_id, start, end in q.yield_per(5000):
+        intervals[l_id].append((start, end))
+
+    result = {}
+    for l in lots:
+        capacity = (l.occupied_count or 0) + (l.available_count or 0)
+        hourly = occupied_seconds(intervals[l.id], date_from, date_to, bucket=HOUR, now=now)
+        result[l.id] = {
+            'lot_id': l.id,
+            'lot_name': l.name,
+            'capacity': capacity,
+            'utilization': hour_of_week_utilization(hourly, date_from, capacity),
+        }
+    return result
+
+
+def parse_summary_args(args):
+    """
+    Normalize the summary query args. ``from`` is inclusive and ``to``
+    exclusive (a bare ``to`` date covers that whole day); both are aligned
+    to the granularity. Raises ValueError with a client-facing message.
+    """
+    granularity = (args.get('granularity') or 'day').lower()
+    if granularity not in GRANULARITIES:
+        raise ValueError('invalid granularity (hour, day or week)')
+
+    raw_sections = args.get('sections')
+    if raw_sections:
+        wanted = {s.strip().lower() for s in raw_sections.split(',') if s.strip()}
+        unknown = wanted - set(SECTIONS)
+        if unknown:
+            raise ValueError('invalid sections: ' + ', '.join(sorted(unknown)))
+        sections = tuple(s for s in SECTIONS if s in wanted)
+    else:
+        sections = SECTIONS
+
+    lot_id = args.get('lot_id')
+    if lot_id not in (None, ''):
+        try:
+            lot_id = int(lot_id)
+        except Exception:
+            raise ValueError('invalid lot_id')
+    else:
+        lot_id = None
+
+    try:
+        limit = int(args.get('limit', RECENT_LIMIT))
+    except Exception:
+        raise ValueError('invalid limit')
+    if limit < 1:
+        raise ValueError('invalid limit')
+
+    before = args.get('before') or None
+    if before:
+        decode_cursor(before)  # validate early
+
+    windowed = bool(args.get('from') or args.get('to'))
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    date_to = parse_when(args['to'], end=True) if args.get('to') else today + timedelta(days=1)
+    try:
+        date_from = parse_when(args['from']) if args.get('from') else date_to - timedelta(days=DEFAULT_DAYS)
+        date_from = _bucket_start(date_from, granularity)
+        if _bucket_start(date_to, granularity) != date_to:
+            date_to = _bucket_start(date_to, granularity) + _bucket_step(granularity)
+    except OverflowError:
+        raise ValueError('date out of range')
+    if date_from >= date_to:
+        raise ValueError('from must be before to')
+    # the reservations series has one entry per bucket
+    if 'reservations' in sections and (date_to - date_from) > _bucket_step(granularity) * MAX_SERIES_BUCKETS:
+        raise ValueError(f'window is limited to {MAX_SERIES_BUCKETS} {granularity} buckets')
+
+    return {
+        'from': date_from,
+        'to': date_to,
+        'granularity': granularity,
+        'lot_id': lot_id,
+        'sections': sections,
+        'limit': min(limit, MAX_RECENT_LIMIT),
+        'before': before,
+        'windowed': windowed,
+        'legacy_series': not windowed and not args.get('granularity'),
+    }
+
+
+def _bucket_start(dt, granularity):
+    if granularity == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    day = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        day -= timedelta(days=day.weekday())  # ISO weeks start on Monday
+    return day
+
+
+def _bucket_step(granularity):
+    return {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[granularity]
+
+
+def _section_cache_part(section, params):
+    """Cache-key suffix made of only the params ``section`` depends on."""
+    lot = params['lot_id'] if params['lot_id'] is not None else 'all'
+    window = f"{params['from']:%Y%m%dT%H}-{params['to']:%Y%m%dT%H}"
+    if section == 'revenue':
+        return f"revenue:{window if params['windowed'] else 'all'}:{lot}"
+    if section == 'reservations':
+        legacy = ':legacy' if params['legacy_series'] else ''
+        return f"reservations:{window}:{params['granularity']}:{lot}{legacy}"
+    if section == 'recent':
+        return f"recent:{lot}:{params['limit']}:{params['before'] or 'head'}"
+    return f"{section}:{lot}"
+
+
+def _rollup_days(query, params):
+    """Restrict a LotDailyRollup query to the window's days (and lot)."""
+    last_day = (params['to'] - timedelta(microseconds=1)).date()
+    query = query.filter(LotDailyRollup.day >= params['from'].date(), LotDailyRollup.day <= last_day)
+    if params['lot_id'] is not None:
+        query = query.filter(LotDailyRollup.lot_id == params['lot_id'])
+    return query
+
+
+def _day_aligned(params):
+    midnight = datetime.min.time()
+    return params['from'].time() == midnight and params['to'].time() == midnight
+
+
+def _revenue_section(params):
+    """
+    Total and per-lot revenue from the daily rollups (one row per lot per
+    day). A window that does not start and end at midnight is summed from
+    the reservations started inside it instead, so the totals cover the
+    same hours as the reservations series.
+    """
+    if params['windowed'] and not _day_aligned(params):
+        return _revenue_from_reservations(params)
+
+    rev_q = db.session.query(
+        LotDailyRollup.lot_id.label('lot_id'),
+        ParkingLot.name.label('lot_name'),
+        func.coalesce(func.sum(LotDailyRollup.revenue), 0.0).label('revenue'),
+        func.coalesce(func.sum(LotDailyRollup.occupied_hours), 0.0).label('occupied_hours')
+    ).outerjoin(ParkingLot, ParkingLot.id == LotDailyRollup.lot_id)
+    if params['windowed']:
+        rev_q = _rollup_days(rev_q, params)
+    elif params['lot_id'] is not None:
+        rev_q = rev_q.filter(LotDailyRollup.lot_id == params['lot_id'])
+    rev_q = rev_q.group_by(LotDailyRollup.lot_id, ParkingLot.name) \
+        .order_by(func.coalesce(func.sum(LotDailyRollup.revenue), 0.0).desc())
+
+    total_revenue = 0.0
+    revenue_per_lot = []
+    for r in rev_q:
+        total_revenue += float(r.revenue or 0.0)
+        if r.lot_name is None:
+            # deleted lot: counts towards the total only
+            continue
+        revenue_per_lot.append({
+            'lot_id': r.lot_id,
+            'lot_name': r.lot_name,
+            'revenue': float(r.revenue or 0.0),
+            'occupied_hours': round(float(r.occupied_hours or 0.0), 2)
+        })
+    return {'total_revenue': float(total_revenue), 'revenue_per_lot': revenue_per_lot}
+
+
+def _revenue_from_reservations(params):
+    """_revenue_section for a sub-day window, with the rollups' attribution (start_time, cost, duration)."""
+    q = db.session.query(ParkingSpot.lot_id, ParkingLot.name, Reservation.start_time,
+                         Reservation.end_time, Reservation.cost) \
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+        .outerjoin(ParkingLot, ParkingLot.id == ParkingSpot.lot_id) \
+        .filter(Reservation.start_time >= params['from'], Reservation.start_time < params['to'])
+    if params['lot_id'] is not None:
+        q = q.filter(ParkingSpot.lot_id == params['lot_id'])
+
+    total_revenue = 0.0
+    per_lot = {}
+    for l_id, name, start, end, cost in q.yield_per(1000):
+        revenue, hours = reservation_rollup_deltas(start, end, cost)
+        total_revenue += revenue
+        if name is None:
+            continue
+        row = per_lot.setdefault(l_id, {'lot_id': l_id, 'lot_name': name, 'revenue': 0.0, 'occupied_hours': 0.0})
+        row['revenue'] += revenue
+        row['occupied_hours'] += hours
+
+    revenue_per_lot = sorted(per_lot.values(), key=lambda r: r['revenue'], reverse=True)
+    for row in revenue_per_lot:
+        row['occupied_hours'] = round(row['occupied_hours'], 2)
+    return {'total_revenue': float(total_revenue), 'revenue_per_lot': revenue_per_lot}
+
+
+def _occupancy_section(params):
+    """Current occupancy per lot, from the counters maintained on ParkingLot."""
+    lots_q = ParkingLot.query
+    if params['lot_id'] is not None:
+        lots_q = lots_q.filter(ParkingLot.id == params['lot_id'])
+    occupancy = []
+    for l in lots_q.order_by(ParkingLot.id).all():
+        occupied = l.occupied_count or 0
+        total = occupied + (l.available_count or 0)
+        occupancy.append({
+            'lot_id': l.id,
+            'lot_name': l.name,
+            'total_spots': total,
+            'occupied': occupied,
+            'available': total - occupied
+        })
+    return {'occupancy': occupancy}
+
+
+def _reservations_section(params):
+    """
+    Reservation count and revenue per time bucket. Day and week buckets are
+    summed from the daily rollups; hour buckets come from the reservations
+    started inside the (bounded) window.
+    """
+    granularity = params['granularity']
+    buckets = {}
+    if granularity == 'hour':
+        q = db.session.query(Reservation.start_time, Reservation.cost) \
+            .filter(Reservation.start_time >= params['from'], Reservation.start_time < params['to'])
+        if params['lot_id'] is not None:
+            q = q.join(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+                .filter(ParkingSpot.lot_id == params['lot_id'])
+        for start, cost in q.yield_per(1000):
+            b = buckets.setdefault(_bucket_start(start, 'hour'), [0, 0.0])
+            b[0] += 1
+            b[1] += float(cost or 0.0)
+    else:
+        day_q = _rollup_days(db.session.query(
+            LotDailyRollup.day.label('d'),
+            func.sum(LotDailyRollup.reservation_count).label('cnt'),
+            func.sum(LotDailyRollup.revenue).label('revenue')
+        ), params).group_by(LotDailyRollup.day)
+        for row in day_q:
+            day = datetime.combine(row.d, datetime.min.time())
+            b = buckets.setdefault(_bucket_start(day, granularity), [0, 0.0])
+            b[0] += int(row.cnt or 0)
+            b[1] += float(row.revenue or 0.0)
+
+    series = []
+    step = _bucket_step(granularity)
+    t = params['from']
+    while t < params['to']:
+        count, revenue = buckets.get(t, (0, 0.0))
+        series.append({
+            'bucket': t.date().isoformat() if granularity != 'hour' else t.isoformat(),
+            'count': count,
+            'revenue': round(revenue, 2)
+        })
+        t += step
+
+    result = {'reservations_series': series}
+    if params['legacy_series']:
+        result['reservations_last_30_days'] = [{'date': s['bucket'], 'count': s['count']} for s in series]
+    return result
+
+
+def _recent_section(params):
+    """A page of the recent-activity feed (see recent_reservations)."""
+    recent, next_cursor = recent_reservations(params['limit'], before=params['before'], lot_id=params['lot_id'])
+    return {'recent_reservations': recent, 'recent_next_cursor': next_cursor}
+
+
+_SECTION_BUILDERS = {
+    'revenue': _revenue_section,
+    'occupancy': _occupancy_section,
+    'reservations': _reservations_section,
+    'recent': _recent_section,
+}
@@ -1,69 +1,96 @@
-from flask import Blueprint, jsonify, current_app
+import queue
+from flask import Blueprint, Response, jsonify, current_app, request
 from ..models.lot import ParkingLot
-from ..utils.cache import cache_get, cache_set
-import json
+from ..utils.cache import cache_get
+from ..utils.lot_events import get_lot_event_hub, sse_event, HEARTBEAT_SECONDS
+from ._lot_utils import cached_lots_summary, cache_summary_rows, lot_summary_key, summary_row
 
 api_bp = Blueprint('api', __name__)
 
-# TTL for cached results (seconds)
-CACHE_TTL = 30  # adjust as desired
+@api_bp.route('/lots/summary')
+def lots_summary():
+    """
+    Returns lots summary. Each lot's row is cached under its own key and
+    written through by reserve/release/admin edits (see _lot_utils), so a
+    write only refreshes its own lot and the listing stays warm.
+    Availability comes from the counters maintained on ParkingLot.
 
-def _cache_get(key):
-    r = getattr(current_app, 'redis', None)
-    if not r:
-        print(f"[CACHE] redis not configured; skip GET {key}")
-        return None
-    try:
-        val = r.get(key)
-        if val is None:
-            current_app.logger.info("Cache MISS for key=%s", key)
-            print(f"[CACHE] MISS {key}")
-            return None
-        current_app.logger.info("Cache HIT for key=%s", key)
-        print(f"[CACHE] HIT {key}")
-        return json.loads(val)
-    except Exception as e:
-        current_app.logger.info("Redis get error for key=%s: %s", key, e)
-        print(f"[CACHE] GET ERROR {key}: {e}")
-        return None
+    Optional query arg ?lot_id=<id> restricts the summary to one lot.
+    """
+    lot_id = request.args.get('lot_id')
+    if lot_id not in (None, ''):
+        try:
+            lot_id = int(lot_id)
+        except Exception:
+            return jsonify({'error': 'invalid lot_id'}), 400
+        row = cache_get(lot_summary_key(lot_id))
+        if row is None:
+            lot = ParkingLot.query.get(lot_id)
+            if not lot:
+                return jsonify({'error': 'lot not found'}), 404
+            # read path: refill the entry without publishing a lot event
+            row = summary_row(lot)
+            cache_summary_rows({lot.id: row})
+        return jsonify({'summary': [row]})
 
-def _cache_set(key, value, ttl=CACHE_TTL):
-    r = getattr(current_app, 'redis', None)
-    if not r:
-        print(f"[CACHE] redis not configured; skip SET {key}")
-        return
-    try:
-        r.set(key, json.dumps(value), ex=ttl)
-        current_app.logger.info("Cache SET for key=%s (ttl=%s)", key, ttl)
-        print(f"[CACHE] SET {key} ttl={ttl}")
-    except Exception as e:
-        current_app.logger.info("Redis set error for key=%s: %s", key, e)
-        print(f"[CACHE] SET ERROR {key}: {e}")
+    return jsonify({'summary': cached_lots_summary()})
 
 
-@api_bp.route('/lots/summary')
-def lots_summary():
+@api_bp.route('/lots/stream')
+def lots_stream():
     """
-    Returns lots summary. This is cached in Redis for CACHE_TTL seconds.
+    Server-Sent Events stream of lot availability, replacing polling of
+    /api/lots/summary:
+    - ``snapshot``: {summary: [...]} (same rows as /api/lots/summary) on
+      connect, and again if this client fell behind
+    - ``lots``: {lots: [changed rows], deleted: [lot ids]} whenever
+      reserve, release or an admin lot/spot edit commits
+    - a comment line every 15s as heartbeat
+
+    Events arrive through one Redis pub/sub subscription per process
+    (utils/lot_events), so open tabs add no database or Redis reads.
+    Returns 503 when Redis is unavailable; clients then fall back to
+    /api/lots/summary.
     """
-    cache_key = "lots:summary"
-    data = cache_get(cache_key)
-    if data is not None:
-        return jsonify({'summary': data})
+    hub = get_lot_event_hub()
+    if hub is None:
+        return jsonify({'error': 'stream unavailable'}), 503
 
-    lots = ParkingLot.query.all()
-    result = []
+    # subscribe before reading the snapshot so no change falls in between
+    client = hub.connect()
+    try:
+        snapshot = cached_lots_summary()
+    except Exception:
+        hub.disconnect(client)
+        raise
+    app = current_app._get_current_object()
 
-    for l in lots:
-        total = len(l.spots)
-        occupied = sum(1 for s in l.spots if s.status == 'O')
-        free = total - occupied
-        result.append({
-            'lot': l.to_dict(),
-            'total_spots': total,
-            'occupied': occupied,
-            'available': free
-        })
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            yield sse_event('snapshot', {'summary': snapshot})
+            while True:
+                if client.resync:
+                    client.resync = False
+                    while not client.queue.empty():
+                        client.queue.get_nowait()
+                    # short-lived app context: no DB session is held between events
+                    with app.app_context():
+                        rows = cached_lots_summary()
+                    yield sse_event('snapshot', {'summary': rows})
+                    continue
+                try:
+                    payload = client.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    if not hub.alive():
+                        # subscription thread died: resubscribe (flags a resync)
+                        with app.app_context():
+                            get_lot_event_hub()
+                    yield ": ping\n\n"
+                    continue
+                yield sse_event('lots', payload)
+        finally:
+            hub.disconnect(client)
 
-    cache_set(cache_key, result)
-    return jsonify({'summary': result})
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
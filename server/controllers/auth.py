@@ -64,5 +64,13 @@ def login():
     if not user or not user.check_password(password):
         return jsonify({'error': 'invalid credentials'}), 401
 
+    # upgrade hashes made with older/other parameters while we have the plaintext
+    if user.password_needs_rehash():
+        try:
+            user.set_password(password)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
     token = create_token(user)
     return jsonify({'message': 'ok', 'token': token, 'user': user.to_dict()}), 200
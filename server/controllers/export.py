@@ -10,6 +10,7 @@ export_bp = Blueprint('export', __name__)
 def export_csv(user_id):
     """
     Start asynchronous CSV export for a user. Returns task_id (202).
+    Pass ?gzip=1 (or {"gzip": true}) for a gzip-compressed .csv.gz file.
     """
     try:
         # lazy import the task to avoid circular imports
@@ -18,7 +19,10 @@ def export_csv(user_id):
         current_app.logger.exception("Failed to import tasks: %s", e)
         return jsonify({'error': 'tasks_unavailable', 'message': str(e)}), 500
 
-    job = export_reservations_csv_task.delay(user_id)
+    body = request.get_json(silent=True) or {}
+    compress = str(request.args.get('gzip', body.get('gzip', ''))).lower() in ('1', 'true', 'yes')
+
+    job = export_reservations_csv_task.delay(user_id, compress=compress)
     return jsonify({'task_id': job.id}), 202
 
 
@@ -3,12 +3,17 @@ from flask import current_app
 import traceback
 from flask import Blueprint, request, jsonify
 from ._auth_utils import token_required
+from ._lot_utils import adjust_lot_counters, flip_spot_status, write_through_lot_summary
+from ._reservation_utils import parse_page_args, page_cache_part, user_reservations_page, reservations_namespace
+from ._rollup_utils import add_to_rollup, reservation_rollup_deltas
 from ..models import db
+from sqlalchemy import update
 from ..models.spot import ParkingSpot
 from ..models.reservation import Reservation
 from ..models.lot import ParkingLot
 from datetime import datetime
-from ..utils.cache import cache_delete, cache_set, cache_get
+from ..utils.cache import cache_set, cache_get, cache_ns_key, cache_invalidate
+from ..utils.allocator import claim_spot, release_spot
 import math
 
 user_bp = Blueprint('user', __name__)
@@ -17,15 +22,14 @@ user_bp = Blueprint('user', __name__)
 @token_required
 def reserve():
     """
-    Reserve the first available spot in the given lot for the current user.
+    Reserve an available spot in the given lot for the current user.
 
     Safety:
     - Prevent user from having multiple active reservations.
-    - Atomically mark a spot as occupied using an UPDATE ... WHERE status='A'
-      to avoid double-booking in concurrent requests.
+    - The spot is claimed through the per-lot allocator, which still marks it
+      occupied with an UPDATE ... WHERE status='A' to avoid double-booking.
     """
     from datetime import datetime
-    import time
 
     user = getattr(request, 'current_user')
     data = request.get_json() or {}
@@ -47,32 +51,14 @@ def reserve():
     if active:
         return jsonify({'error': 'user already has an active reservation', 'reservation_id': active.id}), 400
 
-    # 2) attempt to find the first available spot and reserve it atomically
-    # We'll try a few times to handle races where another process updates the spot status between select and update.
-    max_attempts = 3
-    attempt = 0
-    chosen_spot = None
-    while attempt < max_attempts:
-        attempt += 1
-        # choose the first available spot deterministically (order by id)
-        spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').order_by(ParkingSpot.id).first()
-        if not spot:
-            # no available spots
-            return jsonify({'error': 'no spots available'}), 400
-
-        # optimistic atomic update: only set status to 'O' if currently 'A'
-        updated = ParkingSpot.query.filter_by(id=spot.id, status='A').update({'status': 'O'})
-        if updated == 1:
-            # we successfully claimed the spot
-            chosen_spot = ParkingSpot.query.get(spot.id)  # reload
-            break
-        else:
-            # another worker/process claimed it — retry a bit
-            # small sleep to reduce hot-looping under heavy concurrency
-            time.sleep(0.05)
-
-    if not chosen_spot:
-        return jsonify({'error': 'no spots available (concurrent conflicts)'}), 400
+    # 2) claim a free spot: the allocator pops a distinct spot id per request
+    # (or falls back to a single UPDATE ... RETURNING), so concurrent requests
+    # don't race for the same row and no retry/sleep loop is needed.
+    spot_id = claim_spot(lot_id)
+    if spot_id is None:
+        return jsonify({'error': 'no spots available'}), 400
+    chosen_spot = ParkingSpot.query.get(spot_id)
+    adjust_lot_counters(lot, occupied=1, available=-1)
 
     # create reservation tied to the claimed spot
     try:
@@ -83,10 +69,14 @@ def reserve():
             notes=notes
         )
         db.session.add(reservation)
+        add_to_rollup(lot_id, reservation.start_time, count=1)
         db.session.commit()
-        # invalidate caches affected: lots summary and this lot's spots + analytics
+        # refresh this lot's summary entry in place; drop its spot listing and
+        # bump the analytics / user-history namespaces
         try:
-            cache_delete("lots:summary", f"lot:{lot_id}:spots", "analytics:summary", f"user:{user.id}:reservations")
+            write_through_lot_summary(lot)
+            cache_invalidate(keys=[f"lot:{lot_id}:spots"],
+                             namespaces=["analytics", reservations_namespace(user.id)])
         except Exception:
             pass
 
@@ -96,6 +86,7 @@ def reserve():
         try:
             ParkingSpot.query.filter_by(id=chosen_spot.id).update({'status': 'A'})
             db.session.commit()
+            release_spot(lot_id, chosen_spot.id)
         except Exception:
             db.session.rollback()
         return jsonify({'error': 'failed to create reservation', 'message': str(e)}), 500
@@ -156,18 +147,18 @@ def release():
     already_released = bool(res.end_time)
     if already_released and not recalc_flag:
         return jsonify({'reservation': res.to_dict(), 'cost': getattr(res, 'cost', None), 'message': 'already released'}), 200
+    # what this reservation already contributed to its daily rollup row
+    prev_revenue, prev_hours = reservation_rollup_deltas(res.start_time, res.end_time, res.cost) \
+        if already_released else (0.0, 0.0)
+    prev_end_time, prev_cost = res.end_time, res.cost
 
     # set end_time if not already set
-    if not res.end_time:
-        res.end_time = datetime.utcnow()
+    end_time = res.end_time or datetime.utcnow()
 
     # append release notes if provided
+    notes = res.notes
     if release_notes:
-        existing = res.notes or ""
-        if existing:
-            res.notes = existing + "\n" + release_notes
-        else:
-            res.notes = release_notes
+        notes = notes + "\n" + release_notes if notes else release_notes
 
     # find spot & lot
     try:
@@ -184,8 +175,8 @@ def release():
     computed_cost = None
     hours_charged = None
     try:
-        if res.start_time and res.end_time:
-            duration_seconds = int((res.end_time - res.start_time).total_seconds())
+        if res.start_time and end_time:
+            duration_seconds = int((end_time - res.start_time).total_seconds())
             # round up to next whole hour
             hours_charged = math.ceil(max(0, duration_seconds) / 3600.0)
             price = float(getattr(lot, 'price_per_hour', 0.0) or 0.0)
@@ -203,28 +194,67 @@ def release():
 
     # decide whether to write cost to reservation:
     # - If reservation has no cost, or recalc_flag == True, update it.
+    cost = prev_cost
     try:
-        if computed_cost is not None and (getattr(res, 'cost', None) is None or recalc_flag):
-            res.cost = float(computed_cost)
+        if computed_cost is not None and (prev_cost is None or recalc_flag):
+            cost = float(computed_cost)
     except Exception:
         pass
 
-    # mark spot available
+    # close the reservation with a compare-and-set on the state read above:
+    # of two concurrent releases only one matches, so the spot, counters and
+    # rollup deltas below are applied once
+    cas = update(Reservation).where(Reservation.id == res.id)
+    if already_released:
+        cas = cas.where(Reservation.end_time == prev_end_time,
+                        Reservation.cost.is_(None) if prev_cost is None else Reservation.cost == prev_cost)
+    else:
+        cas = cas.where(Reservation.end_time.is_(None))
+    try:
+        closed = db.session.execute(
+            cas.values(end_time=end_time, cost=cost, notes=notes)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'failed to save release', 'message': str(e)}), 500
+    if not closed:
+        db.session.rollback()
+        if not already_released:
+            return jsonify({'reservation': res.to_dict(), 'cost': getattr(res, 'cost', None), 'message': 'already released'}), 200
+        return jsonify({'error': 'reservation changed concurrently, retry'}), 409
+
+    # mark spot available (only when this call actually ends the reservation;
+    # a recalculation must not free a spot that has since been re-occupied)
+    freed = False
     try:
-        if spot:
-            spot.status = 'A'
+        if spot and not already_released and flip_spot_status(spot.id, 'A'):
+            freed = True
+            if lot:
+                adjust_lot_counters(lot, occupied=-1, available=1)
     except Exception:
         pass
 
+    # move the reservation's revenue / occupied hours into the lot's daily rollup
+    try:
+        if lot:
+            revenue, hours = reservation_rollup_deltas(res.start_time, end_time, cost)
+            add_to_rollup(lot.id, res.start_time, revenue=revenue - prev_revenue, hours=hours - prev_hours)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'failed to save release', 'message': str(e)}), 500
+
     # commit changes
     try:
         db.session.commit()
         lot_id = getattr(lot, 'id', None)
+        if freed and lot_id:
+            release_spot(lot_id, spot.id)
         try:
-            keys = ["lots:summary", "analytics:summary", f"user:{res.user_id}:reservations"]
             if lot_id:
-                keys.append(f"lot:{lot_id}:spots")
-            cache_delete(*keys)
+                write_through_lot_summary(lot)
+            cache_invalidate(keys=[f"lot:{lot_id}:spots"] if lot_id else [],
+                             namespaces=["analytics", reservations_namespace(res.user_id)])
         except Exception:
             pass
     except Exception as e:
@@ -246,10 +276,13 @@ def release():
 @user_bp.route('/reservations/<int:user_id>', methods=['GET', 'OPTIONS'])
 @token_required
 def reservations(user_id):
-    cache_key = f"user:{user_id}:reservations"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return jsonify({'reservations': cached})
+    """
+    Paged reservation history of a user (owner or admin).
+
+    Query args: limit (default 50, max 500), cursor (from a previous
+    next_cursor), from / to (ISO date or datetime on start_time), lot_id,
+    active (true|false). Each page is cached under its own key.
+    """
     try:
         current = getattr(request, 'current_user', None)
         current_app.logger.debug(f"[DEBUG] reservations called. requester: {getattr(current,'id', None)} username: {getattr(current,'username', None)} target_user_id: {user_id}")
@@ -264,48 +297,20 @@ def reservations(user_id):
         if current.id != user_id and current.role != 'admin':
             return jsonify({'error': 'forbidden'}), 403
 
-        resvs = Reservation.query.filter_by(user_id=user_id).order_by(Reservation.start_time.desc()).all()
-
-        out = []
-        for r in resvs:
-            # build enriched dict with spot/lot and durations
-            spot = ParkingSpot.query.get(r.spot_id) if r.spot_id else None
-            lot = ParkingLot.query.get(spot.lot_id) if (spot and getattr(spot, "lot_id", None)) else None
-
-            # canonical fields returned to frontend
-            rd = {
-                'id': r.id,
-                'user_id': r.user_id,
-                'spot_id': r.spot_id,
-                'spot_number': getattr(spot, "number", None),
-                'lot_id': getattr(lot, "id", None),
-                'lot_name': getattr(lot, "name", None),
-                'start_time': r.start_time.isoformat() if r.start_time else None,
-                'end_time': r.end_time.isoformat() if r.end_time else None,
-                'cost': getattr(r, 'cost', None),
-                'remarks': getattr(r, 'notes', None)
-            }
-
-            # compute duration_seconds if end_time exists
-            duration_seconds = None
-            try:
-                if r.start_time and r.end_time:
-                    duration_seconds = int((r.end_time - r.start_time).total_seconds())
-                    rd['duration_seconds'] = duration_seconds
-                else:
-                    # optionally provide current duration for active reservations:
-                    # uncomment next lines if you want live duration for active rows
-                    # if r.start_time and not r.end_time:
-                    #     duration_seconds_now = int((datetime.utcnow() - r.start_time).total_seconds())
-                    #     rd['duration_seconds_current'] = duration_seconds_now
-                    rd['duration_seconds'] = None
-            except Exception:
-                rd['duration_seconds'] = None
-
-            out.append(rd)
+        try:
+            page_args = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        cache_key = cache_ns_key(reservations_namespace(user_id), page_cache_part(page_args))
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        out = user_reservations_page(user_id, page_args)
 
         cache_set(cache_key, out, ttl=30)
-        return jsonify({'reservations': out})
+        return jsonify(out)
 
     except Exception as e:
         tb = traceback.format_exc()
@@ -318,43 +323,25 @@ def history():
     """
     Return reservation history for the currently authenticated user.
     Enriched with spot.number, lot.id/name, duration_seconds, cost and notes.
+    Accepts the same paging/filter args as /user/reservations/<id>.
     """
     try:
         current = getattr(request, 'current_user', None)
         if not current:
             return jsonify({'error': 'unauthenticated'}), 401
 
-        resvs = Reservation.query.filter_by(user_id=current.id).order_by(Reservation.start_time.desc()).all()
+        try:
+            page_args = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        out = []
-        for r in resvs:
-            spot = ParkingSpot.query.get(r.spot_id) if r.spot_id else None
-            lot = ParkingLot.query.get(spot.lot_id) if (spot and getattr(spot, "lot_id", None)) else None
+        cache_key = cache_ns_key(reservations_namespace(current.id), page_cache_part(page_args))
+        page = cache_get(cache_key)
+        if page is None:
+            page = user_reservations_page(current.id, page_args)
+            cache_set(cache_key, page, ttl=30)
 
-            duration_seconds = None
-            try:
-                if r.start_time and r.end_time:
-                    duration_seconds = int((r.end_time - r.start_time).total_seconds())
-            except Exception:
-                duration_seconds = None
-
-            out.append({
-                'id': r.id,
-                'start_time': r.start_time.isoformat() if r.start_time else None,
-                'end_time': r.end_time.isoformat() if r.end_time else None,
-                'duration_seconds': duration_seconds,
-                'cost': getattr(r, 'cost', None),
-                'notes': getattr(r, 'notes', None),
-                'spot_id': getattr(spot, 'id', None),
-                'spot_number': getattr(spot, 'number', None),
-                'lot': {
-                    'id': getattr(lot, 'id', None),
-                    'name': getattr(lot, 'name', None),
-                    'price_per_hour': getattr(lot, 'price_per_hour', None)
-                } if lot else None
-            })
-
-        return jsonify({'user': {'id': current.id, 'username': current.username, 'email': current.email}, 'reservations': out}), 200
+        return jsonify({'user': {'id': current.id, 'username': current.username, 'email': current.email}, **page}), 200
 
     except Exception as e:
         import traceback
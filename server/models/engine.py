@@ -0,0 +1,37 @@
+# server/models/engine.py
+"""
+Engine tuning applied at app start-up.
+
+Pool options come from Config.SQLALCHEMY_ENGINE_OPTIONS (read by
+Flask-SQLAlchemy itself). For SQLite, every new DB-API connection also gets
+Config.SQLITE_PRAGMAS: WAL lets readers run alongside the single writer,
+busy_timeout makes a writer wait for the lock instead of failing with
+"database is locked", synchronous=NORMAL is durable under WAL except for
+the last commits on power loss, and cache_size/mmap_size keep hot pages in
+memory.
+"""
+import sqlite3
+from sqlalchemy import event
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run ``PRAGMA name=value`` for each item on every new SQLite connection of ``engine``."""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, connection_record):
+        if not isinstance(dbapi_conn, sqlite3.Connection):
+            return
+        cursor = dbapi_conn.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def init_engine(app, db):
+    """Hook the SQLite pragmas onto the app's engine (call after db.init_app)."""
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine, app.config.get('SQLITE_PRAGMAS') or {})
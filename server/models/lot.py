@@ -7,6 +7,14 @@ class ParkingLot(db.Model):
     price_per_hour = db.Column(db.Float, default=0.0)
     capacity = db.Column(db.Integer, default=0)
 
+    # maintained occupancy counters (updated in the same transaction as the
+    # spot status changes; see controllers/_lot_utils.adjust_lot_counters)
+    occupied_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    available_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # bumped in every transaction that changes the lot's summary row, so the
+    # cached/pushed rows can be ordered (see _lot_utils.write_through_lot_summary)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     spots = db.relationship('ParkingSpot', backref='lot', cascade='all, delete-orphan')
 
     def to_dict(self):
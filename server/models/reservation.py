@@ -4,6 +4,15 @@ from datetime import datetime
 
 class Reservation(db.Model):
     __tablename__ = 'reservation'  # ensure consistent table name
+    __table_args__ = (
+        # active reservation of a user / of a spot (end_time IS NULL)
+        db.Index('ix_reservation_user_end', 'user_id', 'end_time'),
+        db.Index('ix_reservation_spot_end', 'spot_id', 'end_time'),
+        # a user's history, newest first (keyset on start_time, id)
+        db.Index('ix_reservation_user_start', 'user_id', 'start_time'),
+        # recent activity and per-day analytics
+        db.Index('ix_reservation_start', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
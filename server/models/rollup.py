@@ -0,0 +1,36 @@
+# server/models/rollup.py
+from . import db
+from datetime import datetime
+
+class LotDailyRollup(db.Model):
+    """
+    Reservation aggregates per lot per day (UTC date of start_time), read by
+    the analytics summary instead of scanning the reservation table.
+
+    Maintained in the reserve/release transactions (see
+    controllers/_rollup_utils) and rebuilt by rebuild_lot_rollups_task.
+    lot_id is not a foreign key: history outlives a deleted lot.
+    """
+    __tablename__ = 'lot_daily_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('lot_id', 'day', name='uq_lot_daily_rollup_lot_day'),
+        db.Index('ix_lot_daily_rollup_day', 'day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+
+    reservation_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    revenue = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    occupied_hours = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'lot_id': self.lot_id,
+            'day': self.day.isoformat() if self.day else None,
+            'reservation_count': self.reservation_count,
+            'revenue': self.revenue,
+            'occupied_hours': self.occupied_hours
+        }
@@ -0,0 +1,56 @@
+# server/models/schema.py
+"""
+Lightweight in-place schema upgrades for existing SQLite databases.
+
+db.create_all() only creates missing tables, so columns and indexes added
+to a model later never reach an existing parking.db. upgrade_schema() adds
+any such missing (nullable or server-defaulted) columns with ALTER TABLE
+and creates missing indexes.
+
+Run it through app.py (automatic at startup) or scripts/upgrade_db.py.
+"""
+from sqlalchemy import inspect, text
+from . import db
+
+
+def _column_ddl(engine, column):
+    ddl = f"{column.name} {column.type.compile(dialect=engine.dialect)}"
+    default = getattr(column.server_default, 'arg', None)
+    if default is not None:
+        if isinstance(default, str):
+            default = "'" + default.replace("'", "''") + "'"
+        else:
+            default = getattr(default, 'text', default)
+        ddl += f" DEFAULT {default}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def upgrade_schema(engine=None):
+    """
+    Add model columns and indexes missing from existing tables. Returns the
+    list of "table.column" / "index <name>" entries that were added.
+    """
+    engine = engine or db.engine
+    insp = inspect(engine)
+    existing_tables = set(insp.get_table_names())
+    added = []
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            have = {c['name'] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in have:
+                    continue
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(engine, column)}"))
+                added.append(f"{table.name}.{column.name}")
+
+            have_ix = {ix['name'] for ix in insp.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in have_ix:
+                    continue
+                index.create(bind=conn, checkfirst=True)
+                added.append(f"index {index.name}")
+    return added
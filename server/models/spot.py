@@ -1,6 +1,11 @@
 from . import db
 
 class ParkingSpot(db.Model):
+    __table_args__ = (
+        # free-spot claims and per-lot occupancy counts
+        db.Index('ix_parking_spot_lot_status', 'lot_id', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
     number = db.Column(db.String(20), nullable=False)
@@ -1,21 +1,42 @@
 from . import db
 from datetime import datetime
+from functools import lru_cache
+from flask import current_app, has_app_context
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# werkzeug's own default; override with PASSWORD_HASH_METHOD (see Config)
+DEFAULT_PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    """Fully spelled-out method ('scrypt' -> 'scrypt:32768:8:1') as stored in hashes."""
+    return generate_password_hash('', method=method, salt_length=1).split('$', 1)[0]
+
+def password_hash_method():
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD') or DEFAULT_PASSWORD_HASH_METHOD
+    return DEFAULT_PASSWORD_HASH_METHOD
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    # scrypt hashes are ~162 chars
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), default='user')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=password_hash_method())
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        """True if the stored hash was made with other parameters than the configured ones."""
+        stored = (self.password_hash or '').split('$', 1)[0]
+        return stored != _method_prefix(password_hash_method())
+
     def to_dict(self):
         return {
             'id': self.id,
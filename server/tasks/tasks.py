@@ -3,7 +3,9 @@ from dotenv import load_dotenv
 import os
 import csv
 from datetime import datetime
-from celery import Celery
+from celery import Celery, Task
+from celery.signals import worker_process_init
+from flask import has_app_context
 import os.path as path
 from datetime import timedelta
 from calendar import monthrange
@@ -21,10 +23,47 @@ REDIS_URL = os.environ.get('REDIS_URL')
 if not REDIS_URL:
     raise ValueError("REDIS_URL is not set in environment variables")
 
+# ---------------------------
+# Flask app per worker process
+# ---------------------------
+# Tasks run inside the app context of one Flask app per worker process,
+# created on worker_process_init (or lazily, e.g. with -P solo), instead of
+# a create_app() per task invocation that rebuilt the engine, the Redis
+# client and the blueprints every time.
+
+_flask_app = None
+
+def get_flask_app():
+    """The worker's Flask app, created once per process."""
+    global _flask_app
+    if _flask_app is None:
+        # imported lazily to avoid circular imports at module load time
+        from server.app import create_app
+        _flask_app = create_app()
+    return _flask_app
+
+@worker_process_init.connect
+def init_worker_app(**kwargs):
+    # a forked child must not reuse the parent's DB / Redis connections
+    global _flask_app
+    _flask_app = None
+    get_flask_app()
+
+class AppContextTask(Task):
+    """Base task: runs in the worker's app context (or the caller's, if one is active)."""
+
+    def __call__(self, *args, **kwargs):
+        if has_app_context():
+            return super().__call__(*args, **kwargs)
+        with get_flask_app().app_context():
+            return super().__call__(*args, **kwargs)
+
+
 celery = Celery(
     "parking_tasks",
     broker=REDIS_URL,
     backend=REDIS_URL,
+    task_cls=AppContextTask,
 )
 
 # Export directory (override with EXPORT_DIR env var if desired)
@@ -125,62 +164,116 @@ def send_email_with_attachment(smtp_host, smtp_port, smtp_user, smtp_pass, from_
         return (False, str(e))
 
 
+# CSV export streams its rows: one joined query read in EXPORT_YIELD_PER
+# batches, written through a large file buffer, with progress reported via
+# update_state every EXPORT_PROGRESS_ROWS rows. The file is written under a
+# hidden .part name and renamed when complete, so /export/list and
+# /export/download never see a half-written export.
+EXPORT_YIELD_PER = int(os.environ.get('EXPORT_YIELD_PER') or 1000)
+EXPORT_PROGRESS_ROWS = int(os.environ.get('EXPORT_PROGRESS_ROWS') or 5000)
+EXPORT_BUFFER_BYTES = 1024 * 1024
+EXPORT_CSV_HEADER = ["reservation_id","lot_id","lot_name","spot_id","spot_number","start_time","end_time","duration_seconds","cost","remarks"]
+
+def _export_progress(task, rows, total):
+    """Publish PROGRESS meta for /export/status; never fails the export."""
+    try:
+        task.update_state(state="PROGRESS", meta={
+            "rows": rows,
+            "total": total,
+            "percent": round(100.0 * rows / total, 1) if total else 100.0,
+        })
+    except Exception:
+        pass
+
+
 @celery.task(bind=True)
-def export_reservations_csv_task(self, user_id):
+def export_reservations_csv_task(self, user_id, compress=False):
     """
     Generate CSV for a user's reservations and return metadata.
-    Result stored in Celery backend: {"filename": "...", "filepath": "..."}
+    With compress=True the file is gzip-compressed (.csv.gz).
+    Result stored in Celery backend: {"filename": "...", "filepath": "...", "rows": n}
     """
-    # import create_app lazily to avoid circular imports at module import time
-    from server.app import create_app
-
-    app = create_app()
-    with app.app_context():
-        from server.models.reservation import Reservation
-        from server.models.spot import ParkingSpot
-        from server.models.lot import ParkingLot
-
-        ensure_export_dir()
-
-        resvs = Reservation.query.filter_by(user_id=user_id).order_by(Reservation.start_time.asc()).all()
-
-        ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-        filename = f"user_{user_id}_reservations_{ts}.csv"
-        filepath = os.path.join(EXPORT_DIR, filename)
-
-        with open(filepath, "w", newline="", encoding="utf-8") as fh:
-            writer = csv.writer(fh)
-            writer.writerow(["reservation_id","lot_id","lot_name","spot_id","spot_number","start_time","end_time","duration_seconds","cost","remarks"])
-            for r in resvs:
-                spot = ParkingSpot.query.get(r.spot_id) if r.spot_id else None
-                lot = ParkingLot.query.get(spot.lot_id) if (spot and getattr(spot, "lot_id", None)) else None
-
-                start_iso = r.start_time.isoformat() if r.start_time else ""
-                end_iso = r.end_time.isoformat() if r.end_time else ""
-                duration = ""
-                try:
-                    if r.start_time and r.end_time:
-                        duration = int((r.end_time - r.start_time).total_seconds())
-                except Exception:
+    import gzip
+    import io
+    from server.models import db
+    from server.models.reservation import Reservation
+    from server.models.spot import ParkingSpot
+    from server.models.lot import ParkingLot
+
+    ensure_export_dir()
+
+    total = db.session.query(db.func.count(Reservation.id)) \
+        .filter(Reservation.user_id == user_id).scalar() or 0
+
+    # plain columns rather than entities: nothing to hydrate per row
+    rows = db.session.query(
+        Reservation.id, ParkingLot.id, ParkingLot.name, ParkingSpot.id, ParkingSpot.number,
+        Reservation.start_time, Reservation.end_time, Reservation.cost, Reservation.notes
+    ).outerjoin(ParkingSpot, Reservation.spot_id == ParkingSpot.id) \
+     .outerjoin(ParkingLot, ParkingSpot.lot_id == ParkingLot.id) \
+     .filter(Reservation.user_id == user_id) \
+     .order_by(Reservation.start_time.asc(), Reservation.id.asc()) \
+     .yield_per(EXPORT_YIELD_PER)
+
+    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    filename = f"user_{user_id}_reservations_{ts}.csv" + (".gz" if compress else "")
+    filepath = os.path.join(EXPORT_DIR, filename)
+    part_path = os.path.join(EXPORT_DIR, f".{filename}.part")
+
+    _export_progress(self, 0, total)
+    written = 0
+    next_progress = EXPORT_PROGRESS_ROWS
+    try:
+        raw = open(part_path, "wb", buffering=EXPORT_BUFFER_BYTES)
+        binary = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) if compress else raw
+        try:
+            with io.TextIOWrapper(binary, encoding="utf-8", newline="", write_through=False) as fh:
+                writer = csv.writer(fh)
+                writer.writerow(EXPORT_CSV_HEADER)
+                batch = []
+                for rid, lot_id, lot_name, spot_id, spot_number, start, end, cost, notes in rows:
                     duration = ""
+                    try:
+                        if start and end:
+                            duration = int((end - start).total_seconds())
+                    except Exception:
+                        duration = ""
+
+                    batch.append([
+                        rid,
+                        "" if lot_id is None else lot_id,
+                        lot_name or "",
+                        "" if spot_id is None else spot_id,
+                        "" if spot_number is None else spot_number,
+                        start.isoformat() if start else "",
+                        end.isoformat() if end else "",
+                        duration,
+                        "" if cost is None else cost,
+                        notes or ""
+                    ])
+                    if len(batch) >= EXPORT_YIELD_PER:
+                        writer.writerows(batch)
+                        written += len(batch)
+                        batch = []
+                        if written >= next_progress:
+                            _export_progress(self, written, total)
+                            next_progress = written + EXPORT_PROGRESS_ROWS
+                if batch:
+                    writer.writerows(batch)
+                    written += len(batch)
+        finally:
+            # TextIOWrapper closes the gzip stream; the raw file must be closed here
+            raw.close()
+        os.replace(part_path, filepath)
+    except Exception:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
 
-                remarks = getattr(r, "notes", None) or ""
-
-                writer.writerow([
-                    r.id,
-                    getattr(lot, "id", ""),
-                    getattr(lot, "name", ""),
-                    getattr(spot, "id", ""),
-                    getattr(spot, "number", ""),
-                    start_iso,
-                    end_iso,
-                    duration,
-                    getattr(r, "cost", ""),
-                    remarks
-                ])
-
-        # Return metadata so status endpoint can expose download link
-        return {"filename": filename, "filepath": filepath}
+    # Return metadata so status endpoint can expose download link
+    return {"filename": filename, "filepath": filepath, "rows": written, "compressed": bool(compress)}
 
 
 # ---------------------------
@@ -264,6 +357,151 @@ def build_monthly_report_html(user, year, month, reservations, totals):
     """
     return html
 
+def _report_period(year=None, month=None):
+    """(year, month, start, end) of the report month; defaults to the current month."""
+    today = datetime.utcnow().date()
+    if year is None or month is None:
+        # default to current month instead of previous month
+        target_year = today.year
+        target_month = today.month
+    else:
+        target_year = int(year)
+        target_month = int(month)
+
+    start_date = datetime(target_year, target_month, 1)
+    last_day = monthrange(target_year, target_month)[1]
+    end_date = datetime(target_year, target_month, last_day, 23, 59, 59)
+    return target_year, target_month, start_date, end_date
+
+
+def _month_reservations_query(start_date, end_date):
+    """(Reservation, ParkingSpot, ParkingLot) rows starting within the month."""
+    from server.controllers._reservation_utils import enriched_reservations_query
+    from server.models.reservation import Reservation
+
+    return enriched_reservations_query().filter(
+        Reservation.start_time >= start_date,
+        Reservation.start_time <= end_date
+    )
+
+
+def build_monthly_report_rows(enriched_rows):
+    """
+    Turn a user's (Reservation, ParkingSpot, ParkingLot) rows into the
+    (rows, totals) pair consumed by build_monthly_report_html.
+    """
+    rows = []
+    totals = {"total_reservations": 0, "total_hours": 0, "total_spent": 0.0, "lot_counts": {}}
+    for r, spot, lot in enriched_rows:
+        start_iso = r.start_time.isoformat() if r.start_time else ""
+        end_iso = r.end_time.isoformat() if r.end_time else ""
+        duration = None
+        try:
+            if r.start_time and r.end_time:
+                duration = int((r.end_time - r.start_time).total_seconds())
+                totals["total_hours"] += (duration/3600.0)
+        except Exception:
+            duration = None
+
+        cost = getattr(r, "cost", 0) or 0.0
+        totals["total_spent"] += float(cost or 0)
+        lot_name = getattr(lot, "name", "") if lot else ""
+        lot_id = getattr(lot, "id", "") if lot else ""
+
+        totals["lot_counts"][lot_name or f"lot_{lot_id}"] = totals["lot_counts"].get(lot_name or f"lot_{lot_id}", 0) + 1
+
+        rows.append({
+            "id": r.id,
+            "lot_name": lot_name,
+            "spot_number": getattr(spot, "number", ""),
+            "start_time": start_iso,
+            "end_time": end_iso,
+            "duration_seconds": duration,
+            "cost": cost
+        })
+
+    totals["total_reservations"] = len(rows)
+    # find most used lot
+    most_used = None
+    if totals["lot_counts"]:
+        most_used = max(totals["lot_counts"].items(), key=lambda kv: kv[1])[0]
+    totals["most_used_lot"] = most_used
+    return rows, totals
+
+
+def deliver_monthly_report(user, target_year, target_month, rows, totals, prefer_pdf=True):
+    """
+    Render one user's report (PDF if preferred and available, HTML otherwise),
+    email it if SMTP is configured and return the task metadata dict.
+    """
+    # build HTML
+    html = build_monthly_report_html(user, target_year, target_month, rows, totals)
+
+    # file names
+    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    filename_base = f"user_{user.id}_monthly_report_{target_year}{target_month:02d}_{ts}"
+    pdf_path = os.path.join(EXPORT_DIR, f"{filename_base}.pdf")
+    html_path = os.path.join(EXPORT_DIR, f"{filename_base}.html")
+
+    # ensure export dir
+    ensure_export_dir()
+
+    # save HTML
+    with open(html_path, "w", encoding="utf-8") as fh:
+        fh.write(html)
+
+    created_file = None
+    created_type = None
+    # try render PDF if preferred
+    if prefer_pdf:
+        try:
+            render_pdf_from_html(html, pdf_path)
+            created_file = pdf_path
+            created_type = "pdf"
+        except Exception as e:
+            # fallback to HTML attachment
+            created_file = html_path
+            created_type = "html"
+    else:
+        created_file = html_path
+        created_type = "html"
+
+    # Send email if SMTP configured
+    notify_results = {"email": None, "created_type": created_type, "created_path": created_file}
+    try:
+        user_email = getattr(user, "email", None)
+        if SMTP_HOST and user_email and created_file:
+            subject = f"ParkEZ Monthly Report — {target_year}-{target_month:02d}"
+            body = f"Hello {getattr(user,'username','')},\n\nPlease find attached your monthly ParkEZ activity report for {target_year}-{target_month:02d}.\n\nRegards,\nParkEZ"
+
+            ok, info = send_email_with_attachment(
+                smtp_host=SMTP_HOST,
+                smtp_port=SMTP_PORT,
+                smtp_user=SMTP_USER,
+                smtp_pass=SMTP_PASS,
+                from_addr=FROM_EMAIL,
+                to_addr=user_email,
+                subject=subject,
+                body_text=body,
+                attachment_path=created_file,
+                attachment_name=os.path.basename(created_file)
+            )
+            notify_results["email"] = {"ok": ok, "info": info, "to": user_email}
+        else:
+            notify_results["email"] = {"ok": False, "info": "SMTP_HOST or user_email or attachment missing"}
+    except Exception as e:
+        notify_results["email"] = {"ok": False, "info": str(e)}
+
+    # Return metadata
+    return {
+        "user_id": user.id,
+        "period": f"{target_year}-{target_month:02d}",
+        "file": os.path.basename(created_file) if created_file else None,
+        "created_type": created_type,
+        "notifications": notify_results
+    }
+
+
 @celery.task(bind=True)
 def monthly_report_task(self, user_id, year=None, month=None, prefer_pdf=True):
     """
@@ -273,164 +511,22 @@ def monthly_report_task(self, user_id, year=None, month=None, prefer_pdf=True):
 
     Returns a dict with metadata about what was generated and email result.
     """
-    # import create_app lazily to avoid circular imports at module import time
-    from server.app import create_app
+    from server.models.reservation import Reservation
+    from server.models.user import User
 
-    app = create_app()
-    with app.app_context():
-        try:
-            from server.models.reservation import Reservation
-            from server.models.spot import ParkingSpot
-            from server.models.lot import ParkingLot
-            from server.models.user import User
-            import sqlalchemy
-        except Exception as e:
-            raise
-
-        # determine target month (previous month if not provided)
-        # today = datetime.utcnow().date()
-        # if year is None or month is None:
-        #     # previous month
-        #     first_of_this_month = today.replace(day=1)
-        #     prev_last_day = first_of_this_month - timedelta(days=1)
-        #     target_year = prev_last_day.year
-        #     target_month = prev_last_day.month
-        # else:
-        #     target_year = int(year)
-        #     target_month = int(month)
-
-        today = datetime.utcnow().date()
-        if year is None or month is None:
-            # default to current month instead of previous month
-            target_year = today.year
-            target_month = today.month
-        else:
-            target_year = int(year)
-            target_month = int(month)
-
-
-        # compute date range
-        start_date = datetime(target_year, target_month, 1)
-        last_day = monthrange(target_year, target_month)[1]
-        end_date = datetime(target_year, target_month, last_day, 23, 59, 59)
-
-        user = User.query.get(user_id)
-        if not user:
-            return {"error": "user_not_found"}
-
-        # fetch reservations in the month
-        resvs = Reservation.query.filter(
-            Reservation.user_id == user_id,
-            Reservation.start_time >= start_date,
-            Reservation.start_time <= end_date
-        ).order_by(Reservation.start_time.asc()).all()
-
-        # prepare rows and totals
-        rows = []
-        totals = {"total_reservations": 0, "total_hours": 0, "total_spent": 0.0, "lot_counts": {}}
-        for r in resvs:
-            spot = ParkingSpot.query.get(r.spot_id) if r.spot_id else None
-            lot = ParkingLot.query.get(spot.lot_id) if (spot and getattr(spot,"lot_id",None)) else None
-            start_iso = r.start_time.isoformat() if r.start_time else ""
-            end_iso = r.end_time.isoformat() if r.end_time else ""
-            duration = None
-            try:
-                if r.start_time and r.end_time:
-                    duration = int((r.end_time - r.start_time).total_seconds())
-                    totals["total_hours"] += (duration/3600.0)
-            except Exception:
-                duration = None
-
-            cost = getattr(r, "cost", 0) or 0.0
-            totals["total_spent"] += float(cost or 0)
-            lot_name = getattr(lot, "name", "") if lot else ""
-            lot_id = getattr(lot, "id", "") if lot else ""
-
-            totals["lot_counts"][lot_name or f"lot_{lot_id}"] = totals["lot_counts"].get(lot_name or f"lot_{lot_id}", 0) + 1
-
-            rows.append({
-                "id": r.id,
-                "lot_name": lot_name,
-                "spot_number": getattr(spot, "number", ""),
-                "start_time": start_iso,
-                "end_time": end_iso,
-                "duration_seconds": duration,
-                "cost": cost
-            })
-
-        totals["total_reservations"] = len(rows)
-        # find most used lot
-        most_used = None
-        if totals["lot_counts"]:
-            most_used = max(totals["lot_counts"].items(), key=lambda kv: kv[1])[0]
-        totals["most_used_lot"] = most_used
-
-        # build HTML
-        html = build_monthly_report_html(user, target_year, target_month, rows, totals)
-
-        # file names
-        ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-        filename_base = f"user_{user_id}_monthly_report_{target_year}{target_month:02d}_{ts}"
-        pdf_path = os.path.join(EXPORT_DIR, f"{filename_base}.pdf")
-        html_path = os.path.join(EXPORT_DIR, f"{filename_base}.html")
-
-        # ensure export dir
-        ensure_export_dir()
-
-        # save HTML
-        with open(html_path, "w", encoding="utf-8") as fh:
-            fh.write(html)
-
-        created_file = None
-        created_type = None
-        # try render PDF if preferred
-        if prefer_pdf:
-            try:
-                render_pdf_from_html(html, pdf_path)
-                created_file = pdf_path
-                created_type = "pdf"
-            except Exception as e:
-                # fallback to HTML attachment
-                created_file = html_path
-                created_type = "html"
-        else:
-            created_file = html_path
-            created_type = "html"
+    target_year, target_month, start_date, end_date = _report_period(year, month)
 
-        # Send email if SMTP configured
-        notify_results = {"email": None, "created_type": created_type, "created_path": created_file}
-        try:
-            user_email = getattr(user, "email", None)
-            if SMTP_HOST and user_email and created_file:
-                subject = f"ParkEZ Monthly Report — {target_year}-{target_month:02d}"
-                body = f"Hello {getattr(user,'username','')},\n\nPlease find attached your monthly ParkEZ activity report for {target_year}-{target_month:02d}.\n\nRegards,\nParkEZ"
-
-                ok, info = send_email_with_attachment(
-                    smtp_host=SMTP_HOST,
-                    smtp_port=SMTP_PORT,
-                    smtp_user=SMTP_USER,
-                    smtp_pass=SMTP_PASS,
-                    from_addr=FROM_EMAIL,
-                    to_addr=user_email,
-                    subject=subject,
-                    body_text=body,
-                    attachment_path=created_file,
-                    attachment_name=os.path.basename(created_file)
-                )
-                notify_results["email"] = {"ok": ok, "info": info, "to": user_email}
-            else:
-                notify_results["email"] = {"ok": False, "info": "SMTP_HOST or user_email or attachment missing"}
-        except Exception as e:
-            notify_results["email"] = {"ok": False, "info": str(e)}
+    user = User.query.get(user_id)
+    if not user:
+        return {"error": "user_not_found"}
 
-        # Return metadata
-        return {
-            "user_id": user_id,
-            "period": f"{target_year}-{target_month:02d}",
-            "file": os.path.basename(created_file) if created_file else None,
-            "created_type": created_type,
-            "notifications": notify_results
-        }
+    # fetch reservations in the month, joined to spot and lot
+    resvs = _month_reservations_query(start_date, end_date) \
+        .filter(Reservation.user_id == user_id) \
+        .order_by(Reservation.start_time.asc()).all()
+
+    rows, totals = build_monthly_report_rows(resvs)
+    return deliver_monthly_report(user, target_year, target_month, rows, totals, prefer_pdf)
 
 
 @celery.on_after_configure.connect
@@ -443,26 +539,177 @@ def setup_periodic_tasks(sender, **kwargs):
     )
 
 
+# ---------------------------
+# Batched monthly reports
+# ---------------------------
+# Users are processed in id order, REPORT_CHUNK_SIZE users per
+# monthly_report_batch_task. Each batch reads its users' month with one
+# joined range scan (ordered by user, streamed with yield_per) instead of a
+# query per user. Batches are dispatched in waves of REPORT_WAVE_CHUNKS
+# through a chord; when a wave has finished, its callback stores the last
+# user id as the period's watermark in Redis and dispatches the next wave.
+# Re-running enqueue_monthly_reports for the same period resumes after the
+# watermark, so at most one wave is redone after a crash. The watermark is
+# deleted once the last wave is done, so only an incomplete run is resumed
+# and a later call for the same period starts over.
+
+REPORT_CHUNK_SIZE = int(os.environ.get('REPORT_CHUNK_SIZE') or 200)
+REPORT_WAVE_CHUNKS = int(os.environ.get('REPORT_WAVE_CHUNKS') or 10)
+REPORT_YIELD_PER = 500
+REPORT_WATERMARK_TTL = 40 * 24 * 3600  # seconds; outlives the report month
+
+def report_watermark_key(year, month):
+    return f"reports:monthly:{year}-{month:02d}:watermark"
+
+def _get_report_watermark(year, month):
+    from flask import current_app
+    r = getattr(current_app, 'redis', None)
+    if not r:
+        return 0
+    try:
+        return int(r.get(report_watermark_key(year, month)) or 0)
+    except Exception as e:
+        current_app.logger.warning("report watermark read failed: %s", e)
+        return 0
+
+def _set_report_watermark(year, month, user_id):
+    from flask import current_app
+    r = getattr(current_app, 'redis', None)
+    if not r:
+        return
+    try:
+        r.set(report_watermark_key(year, month), int(user_id), ex=REPORT_WATERMARK_TTL)
+    except Exception as e:
+        current_app.logger.warning("report watermark write failed: %s", e)
+
+def _clear_report_watermark(year, month):
+    from flask import current_app
+    r = getattr(current_app, 'redis', None)
+    if not r:
+        return
+    try:
+        r.delete(report_watermark_key(year, month))
+    except Exception as e:
+        current_app.logger.warning("report watermark delete failed: %s", e)
+
+def _dispatch_report_wave(year, month, after_user_id, prefer_pdf, chunk_size):
+    """Chord of the next REPORT_WAVE_CHUNKS batches of users with id > after_user_id."""
+    from celery import chord, group
+    from server.models import db
+    from server.models.user import User
+
+    user_ids = [uid for (uid,) in db.session.query(User.id)
+                .filter(User.id > after_user_id)
+                .order_by(User.id.asc())
+                .limit(chunk_size * REPORT_WAVE_CHUNKS)]
+    if not user_ids:
+        # run complete: nothing left to resume
+        _clear_report_watermark(year, month)
+        return {"period": f"{year}-{month:02d}", "done": True, "watermark": after_user_id}
+
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    chord(group(
+        monthly_report_batch_task.s(c[0], c[-1], year, month, prefer_pdf) for c in chunks
+    ))(monthly_reports_wave_done.s(year, month, user_ids[-1], prefer_pdf, chunk_size))
+
+    return {
+        "period": f"{year}-{month:02d}",
+        "done": False,
+        "after_user_id": after_user_id,
+        "users": len(user_ids),
+        "chunks": len(chunks),
+    }
+
+
 @celery.task(bind=True)
-def enqueue_monthly_reports(self):
+def monthly_report_batch_task(self, first_user_id, last_user_id, year, month, prefer_pdf=True):
     """
-    Enqueue monthly_report_task for every user in the system.
-    This is a single scheduled job that creates tasks for each user.
+    Render and email the reports of every user with first_user_id <= id <= last_user_id
+    from a single joined scan of their reservations in the month.
     """
-    # import create_app lazily to avoid circular import during module load
-    from server.app import create_app
+    from server.models.reservation import Reservation
+    from server.models.user import User
+
+    target_year, target_month, start_date, end_date = _report_period(year, month)
+
+    users = User.query.filter(User.id.between(first_user_id, last_user_id)) \
+        .order_by(User.id.asc()).all()
+
+    stream = iter(_month_reservations_query(start_date, end_date)
+                  .filter(Reservation.user_id.between(first_user_id, last_user_id))
+                  .order_by(Reservation.user_id.asc(), Reservation.start_time.asc())
+                  .yield_per(REPORT_YIELD_PER))
+    pending = next(stream, None)
+
+    reports = emailed = failed = 0
+    for user in users:
+        # rows of users deleted since the scan started have no report
+        while pending is not None and pending[0].user_id < user.id:
+            pending = next(stream, None)
+        mine = []
+        while pending is not None and pending[0].user_id == user.id:
+            mine.append(pending)
+            pending = next(stream, None)
 
-    app = create_app()
-    with app.app_context():
         try:
-            from server.models.user import User
-        except Exception:
-            raise
+            rows, totals = build_monthly_report_rows(mine)
+            result = deliver_monthly_report(user, target_year, target_month, rows, totals, prefer_pdf)
+            reports += 1
+            if (result["notifications"].get("email") or {}).get("ok"):
+                emailed += 1
+        except Exception as e:
+            failed += 1
+            from flask import current_app
+            current_app.logger.warning("monthly report for user %s failed: %s", user.id, e)
+
+    return {
+        "first_user_id": first_user_id,
+        "last_user_id": last_user_id,
+        "reports": reports,
+        "emailed": emailed,
+        "failed": failed,
+    }
+
+
+@celery.task(bind=True)
+def monthly_reports_wave_done(self, results, year, month, last_user_id, prefer_pdf=True, chunk_size=None):
+    """Chord callback: advance the period's watermark and dispatch the next wave."""
+    from flask import current_app
+
+    _set_report_watermark(year, month, last_user_id)
+    results = results or []
+    current_app.logger.info(
+        "monthly reports %s-%02d: wave up to user %s done (%s reports, %s failed)",
+        year, month, last_user_id,
+        sum(r.get("reports", 0) for r in results), sum(r.get("failed", 0) for r in results))
+    return _dispatch_report_wave(year, month, last_user_id, prefer_pdf, chunk_size or REPORT_CHUNK_SIZE)
 
+
+@celery.task(bind=True)
+def enqueue_monthly_reports(self, year=None, month=None, prefer_pdf=True, batched=True,
+                            chunk_size=None, resume=True, after_user_id=None):
+    """
+    Enqueue the monthly reports for every user in the system.
+
+    Batched (default): users are rendered REPORT_CHUNK_SIZE per task in
+    waves. An incomplete run of the period is resumed after its stored
+    watermark unless resume=False or an explicit after_user_id is given; a
+    finished run leaves no watermark, so calling again starts over.
+    With batched=False, one monthly_report_task is enqueued per user.
+    """
+    from server.models.user import User
+
+    if not batched:
         users = User.query.all()
         for u in users:
-            # enqueue a per-user monthly report (previous month)
-            monthly_report_task.delay(u.id)
+            monthly_report_task.delay(u.id, year, month, prefer_pdf)
+        return {"enqueued": len(users)}
+
+    target_year, target_month, _, _ = _report_period(year, month)
+    if after_user_id is None:
+        after_user_id = _get_report_watermark(target_year, target_month) if resume else 0
+    return _dispatch_report_wave(target_year, target_month, int(after_user_id), prefer_pdf,
+                                 int(chunk_size or REPORT_CHUNK_SIZE))
 
 # ---------------------------
 # Daily reminder task
@@ -482,85 +729,129 @@ def send_daily_reminder(self, cutoff_days=7, hour_to_send=18):
     Returns:
       dict summary with list of emails that were attempted.
     """
-    # Import app and models lazily to avoid circular imports at module load time
-    from server.app import create_app
+    # import models lazily to avoid circular imports at module load time
     from server.models.user import User
     from server.models.reservation import Reservation
 
-    app = create_app()
-    with app.app_context():
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=int(cutoff_days or 7))
+    except Exception:
+        cutoff = datetime.utcnow() - timedelta(days=7)
+
+    notified = []
+    skipped_no_email = []
+    candidates = []
+
+    # Iterate users to determine eligibility
+    users = User.query.all()
+    for u in users:
+        # skip admin accounts if role is admin
+        if getattr(u, 'role', None) == 'admin':
+            continue
+
+        last_res = Reservation.query.filter_by(user_id=u.id).order_by(Reservation.start_time.desc()).first()
+        # If user never reserved OR last reservation older than cutoff => candidate
+        if (not last_res) or (last_res and last_res.start_time < cutoff):
+            candidates.append(u)
+
+    # If SMTP is configured, send emails; otherwise return the candidate list for inspection
+    global SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, FROM_EMAIL, FROM_NAME
+    smtp_ok = SMTP_HOST and SMTP_USER and SMTP_PASS and FROM_EMAIL
+
+    # Email body template
+    subject = "ParkEZ — Reminder: Book parking if you need it"
+    body_template = (
+        "Hello {username},\n\n"
+        "We noticed you haven't parked with ParkEZ recently. If you need a parking spot, "
+        "you can visit the ParkEZ dashboard to find and reserve an available spot.\n\n"
+        "Regards,\nParkEZ Team"
+    )
+
+    for u in candidates:
+        to_addr = getattr(u, "email", None)
+        if not to_addr:
+            skipped_no_email.append({'user_id': u.id, 'username': getattr(u, 'username', None)})
+            continue
+
+        # If no SMTP configured, don't attempt sending; just record candidate
+        if not smtp_ok:
+            notified.append({'user_id': u.id, 'email': to_addr, 'sent': False, 'reason': 'smtp_not_configured'})
+            continue
+
+        # Try sending email (using existing helper). It returns (ok, info)
         try:
-            cutoff = datetime.utcnow() - timedelta(days=int(cutoff_days or 7))
-        except Exception:
-            cutoff = datetime.utcnow() - timedelta(days=7)
+            ok, info = send_email_with_attachment(
+                smtp_host=SMTP_HOST,
+                smtp_port=SMTP_PORT,
+                smtp_user=SMTP_USER,
+                smtp_pass=SMTP_PASS,
+                from_addr=FROM_EMAIL,
+                to_addr=to_addr,
+                subject=subject,
+                body_text=body_template.format(username=getattr(u, 'username', 'User')),
+                attachment_path=None,  # no attachment for reminder
+                attachment_name=None
+            )
+
+            notified.append({'user_id': u.id, 'email': to_addr, 'sent': bool(ok), 'info': info})
+        except Exception as e:
+            notified.append({'user_id': u.id, 'email': to_addr, 'sent': False, 'info': str(e)})
 
-        notified = []
-        skipped_no_email = []
-        candidates = []
+    # Return summary so AsyncResult.result contains helpful data
+    return {
+        'cutoff_days': int(cutoff_days),
+        'num_users_total': len(users),
+        'num_candidates': len(candidates),
+        'notified': notified,
+        'skipped_no_email': skipped_no_email
+    }
 
-        # Iterate users to determine eligibility
-        users = User.query.all()
-        for u in users:
-            # skip admin accounts if role is admin
-            if getattr(u, 'role', None) == 'admin':
-                continue
-
-            last_res = Reservation.query.filter_by(user_id=u.id).order_by(Reservation.start_time.desc()).first()
-            # If user never reserved OR last reservation older than cutoff => candidate
-            if (not last_res) or (last_res and last_res.start_time < cutoff):
-                candidates.append(u)
-
-        # If SMTP is configured, send emails; otherwise return the candidate list for inspection
-        global SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, FROM_EMAIL, FROM_NAME
-        smtp_ok = SMTP_HOST and SMTP_USER and SMTP_PASS and FROM_EMAIL
-
-        # Email body template
-        subject = "ParkEZ — Reminder: Book parking if you need it"
-        body_template = (
-            "Hello {username},\n\n"
-            "We noticed you haven't parked with ParkEZ recently. If you need a parking spot, "
-            "you can visit the ParkEZ dashboard to find and reserve an available spot.\n\n"
-            "Regards,\nParkEZ Team"
-        )
 
-        for u in candidates:
-            to_addr = getattr(u, "email", None)
-            if not to_addr:
-                skipped_no_email.append({'user_id': u.id, 'username': getattr(u, 'username', None)})
-                continue
+# ---------------------------
+# Lot counter reconciliation
+# ---------------------------
 
-            # If no SMTP configured, don't attempt sending; just record candidate
-            if not smtp_ok:
-                notified.append({'user_id': u.id, 'email': to_addr, 'sent': False, 'reason': 'smtp_not_configured'})
-                continue
+@celery.task(bind=True)
+def reconcile_lot_counters_task(self, lot_id=None):
+    """
+    Repair drift in the occupied_count / available_count counters kept on
+    ParkingLot by recounting parking_spot rows (all lots, or one lot).
+    Returns {'checked_lot_id': ..., 'repaired': [...]}.
+    """
+    from server.controllers._lot_utils import reconcile_lot_counters, write_through_lot_summary
+    from server.models.lot import ParkingLot
+    from server.utils.cache import cache_bump
 
-            # Try sending email (using existing helper). It returns (ok, info)
-            try:
-                ok, info = send_email_with_attachment(
-                    smtp_host=SMTP_HOST,
-                    smtp_port=SMTP_PORT,
-                    smtp_user=SMTP_USER,
-                    smtp_pass=SMTP_PASS,
-                    from_addr=FROM_EMAIL,
-                    to_addr=to_addr,
-                    subject=subject,
-                    body_text=body_template.format(username=getattr(u, 'username', 'User')),
-                    attachment_path=None,  # no attachment for reminder
-                    attachment_name=None
-                )
-
-                notified.append({'user_id': u.id, 'email': to_addr, 'sent': bool(ok), 'info': info})
-            except Exception as e:
-                notified.append({'user_id': u.id, 'email': to_addr, 'sent': False, 'info': str(e)})
+    repaired = reconcile_lot_counters(lot_id)
+    if repaired:
+        lots = ParkingLot.query.filter(ParkingLot.id.in_([r['lot_id'] for r in repaired])).all()
+        write_through_lot_summary(*lots)
+        cache_bump("analytics")
+    return {'checked_lot_id': lot_id, 'repaired': repaired}
+
+
+# ---------------------------
+# Daily analytics rollups
+# ---------------------------
+
+ROLLUP_REPAIR_DAYS = int(os.environ.get('ROLLUP_REPAIR_DAYS') or 2)
+
+@celery.task(bind=True)
+def rebuild_lot_rollups_task(self, days=ROLLUP_REPAIR_DAYS, lot_id=None):
+    """
+    Recompute the per-lot daily rollups of the last ``days`` days (today
+    included) from the reservation table; days=None rebuilds all history
+    (backfill). Returns {'since': ..., 'lot_id': ..., 'rows': n}.
+    """
+    from server.controllers._rollup_utils import rebuild_lot_rollups
+    from server.utils.cache import cache_bump
 
-        # Return summary so AsyncResult.result contains helpful data
-        return {
-            'cutoff_days': int(cutoff_days),
-            'num_users_total': len(users),
-            'num_candidates': len(candidates),
-            'notified': notified,
-            'skipped_no_email': skipped_no_email
-        }
+    since = None
+    if days is not None:
+        since = datetime.utcnow().date() - timedelta(days=max(1, int(days)) - 1)
+    rows = rebuild_lot_rollups(since=since, lot_id=lot_id)
+    cache_bump("analytics")
+    return {'since': since.isoformat() if since else None, 'lot_id': lot_id, 'rows': rows}
 
 
 # ---------------------------
@@ -574,6 +865,8 @@ def setup_periodic_tasks(sender, **kwargs):
     """
     Register scheduled tasks:
       - daily reminder: every day at 18:00 UTC (configurable)
+      - reconcile_lot_counters_task: hourly at :15
+      - rebuild_lot_rollups_task: daily at 00:30 UTC (repairs recent days)
       - enqueue_monthly_reports: ran by existing schedule (1st of month)
     """
     # Daily reminder: run each day at 18:00 UTC (change hour/minute below as needed)
@@ -584,6 +877,20 @@ def setup_periodic_tasks(sender, **kwargs):
         name='daily-reminder'
     )
 
+    # Hourly repair of the maintained lot occupancy counters
+    sender.add_periodic_task(
+        crontab(minute=15),
+        reconcile_lot_counters_task.s(),
+        name='reconcile-lot-counters'
+    )
+
+    # Nightly repair of the recent analytics rollup days
+    sender.add_periodic_task(
+        crontab(hour=0, minute=30),
+        rebuild_lot_rollups_task.s(),
+        name='rebuild-lot-rollups'
+    )
+
     # Keep existing monthly enqueue task registration (if present)
     try:
         sender.add_periodic_task(
@@ -0,0 +1,141 @@
+# server/utils/allocator.py
+"""
+Per-lot free-spot allocator.
+
+Each lot keeps a Redis sorted set ``lot:{id}:free`` holding the ids of
+its available spots (scored by id). ``claim_spot`` pops the lowest member
+(ZPOPMIN) so concurrent reservations each get a different spot instead of
+all racing for the same lowest-id row, while lots still fill from the
+first spot up. The database stays the source of truth: a popped id is
+only used if the conditional ``UPDATE ... WHERE status='A'`` succeeds.
+
+When Redis is not configured, or the set is missing/empty, the claim
+falls back to a single ``UPDATE ... RETURNING`` statement and the set is
+rebuilt from the database.
+"""
+from flask import current_app
+from sqlalchemy import select, update
+from ..models import db
+from ..models.spot import ParkingSpot
+
+# how many stale ids we tolerate popping before falling back to SQL
+MAX_POPS = 5
+
+
+def _get_redis():
+    return getattr(current_app, 'redis', None)
+
+
+def free_key(lot_id):
+    return f"lot:{lot_id}:free"
+
+
+def _mark_occupied(spot_id):
+    """Conditionally flip a spot from 'A' to 'O'. Returns True on success."""
+    updated = ParkingSpot.query.filter_by(id=spot_id, status='A').update(
+        {'status': 'O'}, synchronize_session=False)
+    return updated == 1
+
+
+def _sql_claim(lot_id):
+    """
+    Claim the lowest-id available spot of a lot in one statement.
+    Returns the claimed spot id or None when the lot is full.
+    """
+    first_free = select(ParkingSpot.id) \
+        .where(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A') \
+        .order_by(ParkingSpot.id).limit(1).scalar_subquery()
+
+    if db.engine.dialect.update_returning:
+        stmt = update(ParkingSpot) \
+            .where(ParkingSpot.id == first_free, ParkingSpot.status == 'A') \
+            .values(status='O') \
+            .returning(ParkingSpot.id) \
+            .execution_options(synchronize_session=False)
+        return db.session.execute(stmt).scalar()
+
+    # dialects without RETURNING: select then conditional update
+    spot_id = db.session.execute(select(first_free)).scalar()
+    if spot_id is not None and _mark_occupied(spot_id):
+        return spot_id
+    return None
+
+
+def rebuild_free_spots(lot_id):
+    """Rebuild the free set of a lot from the database. Returns the free ids."""
+    ids = [row[0] for row in db.session.query(ParkingSpot.id)
+           .filter_by(lot_id=lot_id, status='A').all()]
+    r = _get_redis()
+    if not r:
+        return ids
+    try:
+        pipe = r.pipeline()
+        pipe.delete(free_key(lot_id))
+        if ids:
+            pipe.zadd(free_key(lot_id), {i: i for i in ids})
+        pipe.execute()
+        current_app.logger.debug("[ALLOC] rebuilt %s (%s free)", free_key(lot_id), len(ids))
+    except Exception as e:
+        current_app.logger.exception("Allocator rebuild error for lot=%s: %s", lot_id, e)
+    return ids
+
+
+def claim_spot(lot_id):
+    """
+    Mark one available spot of the lot as occupied inside the current
+    transaction and return its id, or None if the lot is full.
+    The caller commits (or rolls back and calls ``release_spot``).
+    """
+    r = _get_redis()
+    if r:
+        try:
+            for _ in range(MAX_POPS):
+                popped = r.zpopmin(free_key(lot_id))
+                if not popped:
+                    break
+                spot_id = int(popped[0][0])
+                if _mark_occupied(spot_id):
+                    return spot_id
+                # stale entry (spot already taken or deleted); try the next one
+        except Exception as e:
+            current_app.logger.exception("Allocator pop error for lot=%s: %s", lot_id, e)
+
+    spot_id = _sql_claim(lot_id)
+    if spot_id is not None and r:
+        # the set was missing or out of date: refill it with what is still
+        # free (the spot claimed above is already 'O' in this transaction)
+        rebuild_free_spots(lot_id)
+    return spot_id
+
+
+def release_spot(lot_id, *spot_ids):
+    """Return spots to the lot's free set (after they were set back to 'A')."""
+    r = _get_redis()
+    if not r or not spot_ids:
+        return
+    try:
+        r.zadd(free_key(lot_id), {i: i for i in spot_ids})
+    except Exception as e:
+        current_app.logger.exception("Allocator release error for lot=%s: %s", lot_id, e)
+
+
+def remove_spots(lot_id, *spot_ids):
+    """Drop spots from the lot's free set (occupied by an admin or deleted)."""
+    r = _get_redis()
+    if not r or not spot_ids:
+        return
+    try:
+        r.zrem(free_key(lot_id), *spot_ids)
+    except Exception as e:
+        current_app.logger.exception("Allocator remove error for lot=%s: %s", lot_id, e)
+
+
+def drop_lot(lot_id):
+    """Forget the free set of a deleted lot."""
+    r = _get_redis()
+    if not r:
+        return
+    try:
+        r.delete(free_key(lot_id))
+    except Exception as e:
+        current_app.logger.exception("Allocator drop error for lot=%s: %s", lot_id, e)
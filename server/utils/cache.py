@@ -1,6 +1,27 @@
 # server/utils/cache.py
+"""
+The one cache layer used by every controller and task.
+
+  cache_get / cache_get_many / cache_set / cache_set_many / cache_delete
+  cache_set_if_newer                 versioned SET, older writers are dropped
+  cache_ns_key / cache_bump          versioned namespaces, O(1) invalidation
+  cache_invalidate                   delete keys + bump namespaces, optionally after the response
+  get_or_compute                     single-flight fill with early refresh
+  cache_stats                        per-tier hits/misses, Redis latency
+
+All calls degrade to a no-op/miss when Redis is not configured or fails;
+failures are logged and counted, successful calls are not logged.
+"""
 import json
-from flask import current_app
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app, g, has_request_context
+from .codecs import encode, decode, resolve_codec, resolve_compression, DEFAULT_COMPRESS_MIN_BYTES
 
 DEFAULT_TTL = 30  # seconds
 
@@ -8,41 +29,588 @@ def _get_redis():
     r = getattr(current_app, 'redis', None)
     return r
 
+def _get_raw_redis():
+    """
+    Bytes-mode twin of app.redis (which uses decode_responses=True), for
+    binary cache payloads. Shares the connection settings of app.redis.
+    """
+    r = _get_redis()
+    if not r:
+        return None
+    cached = current_app.extensions.get('cache_raw_redis')
+    if cached is None or cached[0] is not r:
+        import redis as _redis
+        pool = r.connection_pool
+        raw = _redis.Redis(connection_pool=_redis.ConnectionPool(
+            connection_class=pool.connection_class,
+            **dict(pool.connection_kwargs, decode_responses=False)
+        ))
+        cached = current_app.extensions['cache_raw_redis'] = (r, raw)
+    return cached[1]
+
+# ---------------------------
+# Codec (see utils/codecs.py)
+# ---------------------------
+# CACHE_CODEC: auto | json | orjson | msgpack
+# CACHE_COMPRESSION: auto | none | zlib | brotli, applied from CACHE_COMPRESS_MIN_BYTES up.
+# Every stored value records its codec, so changing these never breaks
+# entries already in Redis.
+
+_DEFAULT_CODEC = ('json', 'none', DEFAULT_COMPRESS_MIN_BYTES)
+
+def _codec():
+    return current_app.extensions.get('cache_codec', _DEFAULT_CODEC)
+
+def _dumps(value):
+    codec, compression, min_bytes = _codec()
+    return encode(value, codec, compression, min_bytes)
+
+# ---------------------------
+# L1: per-process LRU in front of Redis (optional, CACHE_L1_ENABLED)
+# ---------------------------
+# Hot keys are answered from process memory without a Redis round trip or a
+# json.loads. Entries live at most CACHE_L1_TTL seconds (or the key's own TTL
+# if shorter), and every write through this module publishes the touched
+# keys on INVALIDATION_CHANNEL so the other workers drop their copies.
+# Values are shared between requests: treat them as read-only.
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+_MISS = object()
+
+class LocalCache:
+    """Bounded, thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, max_items=1024, ttl=5):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.origin = None      # id of this process on the invalidation channel
+        self.pid = None
+        self.listener = None    # pub/sub worker thread
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISS
+            expires, value = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return _MISS
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for k in keys:
+                self._data.pop(k, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_listener_lock = threading.Lock()
+
+def init_cache(app):
+    """
+    Resolve the cache codec, hook up deferred invalidation and create the
+    L1 cache for this app (if enabled and Redis is configured).
+    """
+    app.extensions['cache_codec'] = (
+        resolve_codec(app.config.get('CACHE_CODEC', 'auto')),
+        resolve_compression(app.config.get('CACHE_COMPRESSION', 'auto')),
+        int(app.config.get('CACHE_COMPRESS_MIN_BYTES', DEFAULT_COMPRESS_MIN_BYTES))
+    )
+    app.after_request(_flush_deferred)
+    if app.config.get('CACHE_L1_ENABLED') and getattr(app, 'redis', None):
+        app.extensions['cache_l1'] = LocalCache(
+            max_items=app.config.get('CACHE_L1_MAX_ITEMS', 1024),
+            ttl=app.config.get('CACHE_L1_TTL', 5)
+        )
+
+def _start_listener(r, l1):
+    # (re)subscribe; whatever we hold may have missed invalidations meanwhile
+    l1.clear()
+    l1.pid = os.getpid()
+    l1.origin = uuid.uuid4().hex
+
+    def on_message(message):
+        try:
+            data = json.loads(message['data'])
+            if data.get('o') != l1.origin:
+                l1.delete(*data.get('k', []))
+        except Exception:
+            l1.clear()
+
+    pubsub = r.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{INVALIDATION_CHANNEL: on_message})
+    l1.listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+def _get_l1():
+    l1 = current_app.extensions.get('cache_l1')
+    if l1 is None:
+        return None
+    # started lazily so forked workers (gunicorn/celery) get their own thread
+    if l1.pid != os.getpid() or l1.listener is None or not l1.listener.is_alive():
+        with _listener_lock:
+            if l1.pid != os.getpid() or l1.listener is None or not l1.listener.is_alive():
+                try:
+                    _start_listener(current_app.redis, l1)
+                except Exception as e:
+                    current_app.logger.exception("Cache invalidation listener failed: %s", e)
+                    return None
+    return l1
+
+def _queue_invalidation(pipe, l1, keys):
+    """Add the PUBLISH telling other workers to drop ``keys`` to a pipeline."""
+    if l1 is not None and keys:
+        pipe.publish(INVALIDATION_CHANNEL, json.dumps({'o': l1.origin, 'k': list(keys)}))
+
+# ---------------------------
+# Metrics (per process)
+# ---------------------------
+# Hit/miss counters per tier and Redis round-trip latency per operation,
+# kept in memory instead of logging each call. Read with cache_stats().
+
+_stats = {'l1_hits': 0, 'l1_misses': 0, 'l2_hits': 0, 'l2_misses': 0, 'errors': 0}
+_latency = {}  # op -> [calls, total seconds, max seconds]
+_stats_lock = threading.Lock()
+
+def _count(name, n=1):
+    if n:
+        with _stats_lock:
+            _stats[name] += n
+
+def _observe(op, started):
+    elapsed = time.perf_counter() - started
+    with _stats_lock:
+        entry = _latency.get(op)
+        if entry is None:
+            _latency[op] = [1, elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+def _error(message, *args):
+    _count('errors')
+    current_app.logger.exception(message, *args)
+
+def cache_stats():
+    """Snapshot of this process's cache counters and Redis latencies (ms)."""
+    with _stats_lock:
+        stats = dict(_stats)
+        stats['latency_ms'] = {
+            op: {'calls': calls, 'avg': round(total / calls * 1000, 3), 'max': round(worst * 1000, 3)}
+            for op, (calls, total, worst) in _latency.items()
+        }
+    l1 = current_app.extensions.get('cache_l1')
+    stats['l1_enabled'] = l1 is not None
+    stats['l1_size'] = len(l1) if l1 is not None else 0
+    return stats
+
+# ---------------------------
+# Basic get / set / delete
+# ---------------------------
+
 def cache_get(key):
     r = _get_redis()
     if not r:
-        current_app.logger.debug("[CACHE] redis not configured; cache_get skip %s", key)
         return None
+    l1 = _get_l1()
+    if l1 is not None:
+        val = l1.get(key)
+        if val is not _MISS:
+            _count('l1_hits')
+            return val
+        _count('l1_misses')
     try:
-        val = r.get(key)
+        started = time.perf_counter()
+        val = _get_raw_redis().get(key)
+        _observe('get', started)
         if val is None:
-            current_app.logger.debug("[CACHE] MISS %s", key)
+            _count('l2_misses')
             return None
-        current_app.logger.debug("[CACHE] HIT %s", key)
-        return json.loads(val)
+        _count('l2_hits')
+        val = decode(val)
+        if l1 is not None:
+            l1.set(key, val)
+        return val
     except Exception as e:
-        current_app.logger.exception("Redis get error for key=%s: %s", key, e)
+        _error("Redis get error for key=%s: %s", key, e)
         return None
 
 def cache_set(key, value, ttl=DEFAULT_TTL):
+    cache_set_many({key: value}, ttl=ttl)
+
+def cache_get_many(keys):
+    """MGET several keys; returns a list aligned with ``keys`` (None for misses)."""
     r = _get_redis()
-    if not r:
-        current_app.logger.debug("[CACHE] redis not configured; cache_set skip %s", key)
+    if not r or not keys:
+        return [None] * len(keys)
+    l1 = _get_l1()
+    out = [None] * len(keys)
+    todo = list(range(len(keys)))
+    if l1 is not None:
+        todo = []
+        for i, key in enumerate(keys):
+            val = l1.get(key)
+            if val is _MISS:
+                todo.append(i)
+            else:
+                out[i] = val
+        _count('l1_hits', len(keys) - len(todo))
+        _count('l1_misses', len(todo))
+        if not todo:
+            return out
+    try:
+        started = time.perf_counter()
+        vals = _get_raw_redis().mget([keys[i] for i in todo])
+        _observe('mget', started)
+        hits = 0
+        for i, v in zip(todo, vals):
+            if v is not None:
+                hits += 1
+                out[i] = decode(v)
+                if l1 is not None:
+                    l1.set(keys[i], out[i])
+        _count('l2_hits', hits)
+        _count('l2_misses', len(todo) - hits)
+        return out
+    except Exception as e:
+        _error("Redis mget error: %s", e)
+        return out
+
+def cache_set_many(mapping, ttl=DEFAULT_TTL):
+    """SET several key -> value pairs (same TTL) in one pipeline."""
+    r = _get_redis()
+    if not r or not mapping:
         return
+    l1 = _get_l1()
+    try:
+        started = time.perf_counter()
+        pipe = _get_raw_redis().pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, _dumps(value), ex=ttl)
+        _queue_invalidation(pipe, l1, mapping.keys())
+        pipe.execute()
+        _observe('set', started)
+    except Exception as e:
+        _error("Redis pipeline set error: %s", e)
+        if l1 is not None:
+            l1.delete(*mapping)
+        return
+    if l1 is not None:
+        for key, value in mapping.items():
+            l1.set(key, value, ttl)
+
+# Versioned set: KEYS = (key, key:seq), ARGV = (version, payload, ttl, seq ttl).
+# Writes unless the key's last stored version is newer.
+_SET_IF_NEWER_LUA = """
+local cur = tonumber(redis.call('get', KEYS[2]))
+if cur and cur > tonumber(ARGV[1]) then return 0 end
+redis.call('set', KEYS[2], ARGV[1], 'EX', ARGV[4])
+redis.call('set', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+SEQ_TTL = 24 * 3600  # seconds; outlives the values so a late stale writer is still dropped
+
+def seq_key(key):
+    return f"{key}:seq"
+
+def cache_set_if_newer(items, ttl=DEFAULT_TTL):
+    """
+    SET several keys from ``items`` = {key: (version, value)}, each only if
+    ``version`` is not older than the last one stored for it (compared and
+    written atomically in Lua), so a writer holding an older snapshot can't
+    overwrite a newer value. Returns the set of keys written.
+    """
+    r = _get_redis()
+    if not r or not items:
+        return set()
+    l1 = _get_l1()
+    keys = list(items)
     try:
-        r.set(key, json.dumps(value), ex=ttl)
-        current_app.logger.debug("[CACHE] SET %s ttl=%s", key, ttl)
+        started = time.perf_counter()
+        raw = _get_raw_redis()
+        script = raw.register_script(_SET_IF_NEWER_LUA)
+        pipe = raw.pipeline(transaction=False)
+        for key in keys:
+            version, value = items[key]
+            script(keys=[key, seq_key(key)], args=[int(version), _dumps(value), ttl, SEQ_TTL], client=pipe)
+        _queue_invalidation(pipe, l1, keys)
+        results = pipe.execute()[:len(keys)]
+        _observe('set', started)
     except Exception as e:
-        current_app.logger.exception("Redis set error for key=%s: %s", key, e)
+        _error("Redis versioned set error: %s", e)
+        if l1 is not None:
+            l1.delete(*keys)
+        return set()
+    written = {key for key, ok in zip(keys, results) if ok}
+    if l1 is not None:
+        for key in keys:
+            if key in written:
+                l1.set(key, items[key][1], ttl)
+            else:
+                l1.delete(key)
+    return written
+
+# ---------------------------
+# Versioned namespaces
+# ---------------------------
+# A namespace (e.g. "user:42:reservations") owns any number of keys built with
+# cache_ns_key(). Bumping the namespace version orphans all of them at once
+# (they simply age out through their TTL), so invalidation is a single INCR.
+
+def _version_key(namespace):
+    return f"{namespace}:ver"
 
-def cache_delete(*keys):
+def cache_version(namespace):
     r = _get_redis()
     if not r:
-        current_app.logger.debug("[CACHE] redis not configured; cache_delete skip %s", keys)
+        return 0
+    key = _version_key(namespace)
+    l1 = _get_l1()
+    if l1 is not None:
+        ver = l1.get(key)
+        if ver is not _MISS:
+            _count('l1_hits')
+            return ver
+        _count('l1_misses')
+    try:
+        started = time.perf_counter()
+        ver = int(r.get(key) or 0)
+        _observe('version', started)
+    except Exception as e:
+        _error("Redis version read error for ns=%s: %s", namespace, e)
+        return 0
+    if l1 is not None:
+        l1.set(key, ver)
+    return ver
+
+def cache_ns_key(namespace, *parts):
+    key = f"{namespace}:v{cache_version(namespace)}"
+    if parts:
+        key += ":" + ":".join(str(p) for p in parts)
+    return key
+
+# ---------------------------
+# Invalidation
+# ---------------------------
+# cache_delete(), cache_bump() and cache_invalidate() (both at once) share one path: a single pipeline with
+# UNLINK for the keys, INCR for the namespace versions and the L1 PUBLISH.
+# With defer=True (or CACHE_DEFER_INVALIDATION) inside a request, the work is
+# collected on flask.g and sent in one pipeline once the response has been
+# written (response.call_on_close), so a write endpoint's latency no longer
+# grows with the number of views it invalidates. This worker's own L1 copies
+# are dropped immediately either way.
+
+def cache_delete(*keys, defer=None):
+    """Drop keys with one UNLINK (memory is reclaimed off Redis' main thread)."""
+    cache_invalidate(keys=keys, defer=defer)
+
+def cache_bump(*namespaces, defer=None):
+    """Move namespaces to a new version, orphaning all their keys."""
+    cache_invalidate(namespaces=namespaces, defer=defer)
+
+def cache_invalidate(keys=(), namespaces=(), defer=None):
+    """Delete ``keys`` and bump ``namespaces`` in one round trip."""
+    r = _get_redis()
+    if not r or not (keys or namespaces):
+        return
+    l1 = _get_l1()
+    if l1 is not None:
+        l1.delete(*keys)
+    if defer is None:
+        defer = current_app.config.get('CACHE_DEFER_INVALIDATION', False)
+    if defer and has_request_context():
+        pending = g.setdefault('_cache_pending', {'keys': set(), 'namespaces': set()})
+        pending['keys'].update(keys)
+        pending['namespaces'].update(namespaces)
         return
+    _invalidate_now(r, l1, keys, namespaces)
+
+def _invalidate_now(r, l1, keys, namespaces):
+    keys = list(keys)
+    version_keys = [_version_key(ns) for ns in namespaces]
+    try:
+        started = time.perf_counter()
+        pipe = r.pipeline(transaction=False)
+        if keys:
+            pipe.unlink(*keys)
+        for key in version_keys:
+            pipe.incr(key)
+        _queue_invalidation(pipe, l1, keys + version_keys)
+        results = pipe.execute()
+        _observe('invalidate', started)
+    except Exception as e:
+        _error("Redis invalidation error for keys=%s namespaces=%s: %s", keys, namespaces, e)
+        results = None
+    if l1 is not None:
+        l1.delete(*keys)
+        if results:
+            versions = results[1 if keys else 0:][:len(version_keys)]
+            for key, ver in zip(version_keys, versions):
+                l1.set(key, int(ver))
+        else:
+            l1.delete(*version_keys)
+
+def _flush_deferred(response):
+    """after_request hook: send this request's deferred invalidation after the response."""
+    pending = g.pop('_cache_pending', None)
+    if pending:
+        app = current_app._get_current_object()
+
+        def flush():
+            with app.app_context():
+                r = _get_redis()
+                if r:
+                    _invalidate_now(r, _get_l1(), pending['keys'], pending['namespaces'])
+
+        response.call_on_close(flush)
+    return response
+
+# ---------------------------
+# Single-flight fill with early refresh
+# ---------------------------
+# get_or_compute() stores {"v": value, "d": compute seconds, "e": logical
+# expiry} and keeps the key for an extra STALE_GRACE seconds past "e". On a
+# miss or expiry only the worker holding "<key>:lock" (SET NX PX) recomputes;
+# the others serve the stale value, or wait briefly for the winner when there
+# is none. Hot keys are refreshed ahead of expiry with probability growing as
+# "e" approaches (XFetch: now - d * beta * ln(rand) >= e), so under steady
+# traffic they rarely expire at all.
+
+STALE_GRACE = 30     # seconds an expired value may still be served while one worker recomputes
+LOCK_TTL = 10        # seconds; upper bound on a recompute holding the lock
+LOCK_WAIT = 2.0      # seconds a worker without lock or stale value waits for the winner
+LOCK_POLL = 0.05
+
+def _lock_key(key):
+    return f"{key}:lock"
+
+# atomic compare-and-delete: never drop a lock another worker took after ours expired
+_RELEASE_LOCK_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+
+def _release_lock(r, key, token):
     try:
-        for k in keys:
-            r.delete(k)
-            current_app.logger.debug("[CACHE] DEL %s", k)
+        r.eval(_RELEASE_LOCK_LUA, 1, _lock_key(key), token)
     except Exception as e:
-        current_app.logger.exception("Redis del error: %s", e)
+        _error("Redis lock release error for key=%s: %s", key, e)
+
+def _store(r, key, value, delta, ttl, stale_key=None):
+    entry = {'v': value, 'd': delta, 'e': time.time() + ttl}
+    envelope = _dumps(entry)
+    l1 = _get_l1()
+    try:
+        started = time.perf_counter()
+        pipe = _get_raw_redis().pipeline(transaction=False)
+        pipe.set(key, envelope, ex=ttl + STALE_GRACE)
+        if stale_key:
+            pipe.set(stale_key, envelope, ex=ttl + STALE_GRACE)
+        _queue_invalidation(pipe, l1, [key, stale_key] if stale_key else [key])
+        pipe.execute()
+        _observe('set', started)
+    except Exception as e:
+        _error("Redis set error for key=%s: %s", key, e)
+        return
+    if l1 is not None:
+        l1.set(key, entry, ttl)
+
+def _load(r, key):
+    l1 = _get_l1()
+    if l1 is not None:
+        entry = l1.get(key)
+        if entry is not _MISS:
+            _count('l1_hits')
+            return entry
+        _count('l1_misses')
+    try:
+        started = time.perf_counter()
+        raw = _get_raw_redis().get(key)
+        _observe('get', started)
+    except Exception as e:
+        _error("Redis get error for key=%s: %s", key, e)
+        return None
+    if raw is None:
+        _count('l2_misses')
+        return None
+    _count('l2_hits')
+    try:
+        entry = decode(raw)
+    except Exception as e:
+        _error("Cache decode error for key=%s: %s", key, e)
+        return None
+    if l1 is not None:
+        l1.set(key, entry, max(entry['e'] - time.time(), 0))
+    return entry
+
+def _should_refresh(entry, beta):
+    """True once the entry expired, or early with XFetch probability."""
+    gap = -entry.get('d', 0) * beta * math.log(random.random() or 1e-12)
+    return time.time() + gap >= entry['e']
+
+def get_or_compute(key, compute, ttl=DEFAULT_TTL, beta=1.0, stale_key=None):
+    """
+    Return the cached value of ``key``, calling ``compute()`` to fill it.
+    At most one worker recomputes a key at a time (short Redis lock); the
+    others get the stale value or wait up to LOCK_WAIT for the fresh one.
+
+    ``stale_key`` names an extra, unversioned copy to fall back on when
+    ``key`` itself is missing, e.g. right after cache_bump() moved a
+    versioned key. Without Redis this is simply ``compute()``.
+    """
+    r = _get_redis()
+    if not r:
+        return compute()
+
+    entry = _load(r, key)
+    if entry is not None and not _should_refresh(entry, beta):
+        return entry['v']
+    if entry is None and stale_key:
+        entry = _load(r, stale_key)
+
+    token = uuid.uuid4().hex
+    try:
+        locked = r.set(_lock_key(key), token, nx=True, px=int(LOCK_TTL * 1000))
+    except Exception as e:
+        _error("Redis lock error for key=%s: %s", key, e)
+        locked = True  # no coordination possible; behave like a plain miss
+        token = None
+
+    if not locked:
+        if entry is not None:
+            return entry['v']
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = _load(r, key)
+            if entry is not None:
+                return entry['v']
+        # winner is slow or died: compute without caching rather than fail
+        return compute()
+
+    try:
+        started = time.monotonic()
+        value = compute()
+        _store(r, key, value, time.monotonic() - started, ttl, stale_key)
+        return value
+    finally:
+        if token:
+            _release_lock(r, key, token)
@@ -0,0 +1,106 @@
+# server/utils/codecs.py
+"""
+Serialization for cached values: a codec (json, orjson or msgpack) plus
+optional compression (zlib or brotli) for payloads above a size threshold.
+
+Encoded values start with a 4-byte header, b"~" + codec id + compression id
++ b":", so entries written under any configuration keep decoding after the
+settings change. Entries from before this header existed are plain JSON
+text, which never starts with "~", and are decoded as JSON.
+"""
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _json_dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(value):
+    # non-str keys are stringified like json.dumps does
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _msgpack_loads(raw):
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+# name -> (header id, dumps, loads, available)
+CODECS = {
+    'json': (b'j', _json_dumps, json.loads, True),
+    'orjson': (b'o', _orjson_dumps, orjson.loads if orjson else None, orjson is not None),
+    'msgpack': (b'm', lambda v: msgpack.packb(v, use_bin_type=True), _msgpack_loads, msgpack is not None),
+}
+
+COMPRESSORS = {
+    'none': (b'n', None, None, True),
+    'zlib': (b'z', lambda b: zlib.compress(b, 6), zlib.decompress, True),
+    'brotli': (b'b', lambda b: brotli.compress(b, quality=5), brotli.decompress if brotli else None,
+               brotli is not None),
+}
+
+_CODEC_BY_ID = {spec[0]: spec for spec in CODECS.values()}
+_COMPRESSOR_BY_ID = {spec[0]: spec for spec in COMPRESSORS.values()}
+
+DEFAULT_COMPRESS_MIN_BYTES = 1024
+
+
+def resolve_codec(name):
+    """Configured codec name -> an available one ('auto' prefers orjson)."""
+    if name == 'auto':
+        return 'orjson' if orjson is not None else 'json'
+    if name in CODECS and CODECS[name][3]:
+        return name
+    return 'json'
+
+
+def resolve_compression(name):
+    """Configured compression name -> an available one ('auto' prefers brotli)."""
+    if name == 'auto':
+        return 'brotli' if brotli is not None else 'zlib'
+    if name in COMPRESSORS and COMPRESSORS[name][3]:
+        return name
+    return 'zlib' if name == 'brotli' else 'none'
+
+
+def encode(value, codec='json', compression='none', min_bytes=DEFAULT_COMPRESS_MIN_BYTES):
+    """Serialize ``value`` to header + body bytes."""
+    codec_id, dumps, _, _ = CODECS[codec]
+    body = dumps(value)
+    comp_id = b'n'
+    if compression != 'none' and len(body) >= min_bytes:
+        packed = COMPRESSORS[compression][1](body)
+        if len(packed) < len(body):
+            comp_id, body = COMPRESSORS[compression][0], packed
+    return b'~' + codec_id + comp_id + b':' + body
+
+
+def decode(raw):
+    """Inverse of encode(); also reads legacy plain-JSON entries."""
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8')
+    if raw[:1] != b'~' or raw[3:4] != b':':
+        return json.loads(raw)
+    codec = _CODEC_BY_ID.get(raw[1:2])
+    comp = _COMPRESSOR_BY_ID.get(raw[2:3])
+    if codec is None or comp is None or not codec[3] or not comp[3]:
+        raise ValueError(f'cannot decode cached value (codec {raw[1:3]!r} not available)')
+    body = raw[4:]
+    if comp[2] is not None:
+        body = comp[2](body)
+    return codec[2](body)
@@ -0,0 +1,128 @@
+# server/utils/lot_events.py
+"""
+Live lot availability for /api/lots/stream (Server-Sent Events).
+
+Writers publish the changed summary rows once on LOT_EVENTS_CHANNEL after
+their commit (write_through_lot_summary does it for reserve, release and
+the admin lot/spot edits). Each web process keeps a single Redis
+subscription and fans every message out to the queues of its connected
+clients, so Redis and the database see one event per change no matter how
+many browser tabs are open.
+
+A client whose queue overflows (a stalled connection) is flagged for a
+resync and gets a fresh snapshot instead of the events it missed.
+"""
+import json
+import os
+import queue
+import threading
+from flask import current_app
+
+LOT_EVENTS_CHANNEL = "lots:events"
+CLIENT_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+
+_hub_lock = threading.Lock()
+
+
+def publish_lot_event(rows=(), deleted=()):
+    """
+    Broadcast changed summary rows (see _lot_utils.summary_row) and deleted
+    lot ids to every stream client. Call after commit; never raises.
+    """
+    rows, deleted = list(rows), list(deleted)
+    r = getattr(current_app, 'redis', None)
+    if not r or not (rows or deleted):
+        return
+    try:
+        r.publish(LOT_EVENTS_CHANNEL, json.dumps({'lots': rows, 'deleted': deleted}))
+    except Exception as e:
+        current_app.logger.warning("lot event publish failed: %s", e)
+
+
+class StreamClient:
+    """One connected stream: a bounded queue of raw event payloads."""
+    __slots__ = ('queue', 'resync')
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.resync = False
+
+    def push(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            self.resync = True
+
+
+class LotEventHub:
+    """Per-process Redis subscription on LOT_EVENTS_CHANNEL shared by all stream clients."""
+
+    def __init__(self):
+        self.pid = None
+        self.listener = None    # pub/sub worker thread
+        self._clients = set()
+        self._lock = threading.Lock()
+
+    def start(self, r):
+        # clients connected while the subscription was down may have missed events
+        with self._lock:
+            for client in self._clients:
+                client.resync = True
+        self.pid = os.getpid()
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{LOT_EVENTS_CHANNEL: self._on_message})
+        self.listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def alive(self):
+        return self.pid == os.getpid() and self.listener is not None and self.listener.is_alive()
+
+    def _on_message(self, message):
+        payload = message['data']
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.push(payload)
+
+    def connect(self):
+        client = StreamClient()
+        with self._lock:
+            self._clients.add(client)
+        return client
+
+    def disconnect(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def client_count(self):
+        with self._lock:
+            return len(self._clients)
+
+
+def get_lot_event_hub():
+    """
+    The process's hub, subscribed lazily (forked workers get their own
+    thread). None when Redis is not configured or the subscription fails.
+    """
+    r = getattr(current_app, 'redis', None)
+    if not r:
+        return None
+    hub = current_app.extensions.setdefault('lot_events', LotEventHub())
+    if not hub.alive():
+        with _hub_lock:
+            if not hub.alive():
+                try:
+                    hub.start(r)
+                except Exception as e:
+                    current_app.logger.exception("Lot event subscription failed: %s", e)
+                    return None
+    return hub
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event; ``data`` is a JSON string or a JSON-serializable value."""
+    if not isinstance(data, str):
+        data = json.dumps(data)
+    return f"event: {event}\ndata: {data}\n\n"
@@ -0,0 +1,146 @@
+# server/utils/occupancy.py
+"""
+Occupancy over time from reservation intervals.
+
+occupied_seconds() spreads [start, end) intervals over fixed-width time
+buckets with a sweep line: every interval adds +1 at the first bucket it
+covers completely and -1 after the last one (a difference array turned
+into per-bucket counts by one prefix sum), plus the partial seconds at its
+two ends. The cost is O(intervals + buckets), vectorized with NumPy when it
+is installed and in plain Python otherwise, instead of one query or one
+pass over the intervals per bucket.
+
+hour_of_week_utilization() folds hourly buckets into the 168 hours of a
+week (Monday 00:00 first) and divides by the lot capacity.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # optional: pure-Python fallback
+    np = None
+
+HOUR = 3600
+HOURS_PER_WEEK = 168
+
+
+def _offsets(intervals, start, end, now):
+    """(start, end) second offsets from ``start``, clipped to the window; open intervals end at ``now``."""
+    total = (end - start).total_seconds()
+    now = min(now or end, end)
+    out = []
+    for s, e in intervals:
+        if s is None:
+            continue
+        s = max(0.0, (s - start).total_seconds())
+        e = min(total, ((e or now) - start).total_seconds())
+        if e > s:
+            out.append((s, e))
+    return out
+
+
+def occupied_seconds(intervals, start, end, bucket=HOUR, now=None):
+    """
+    Occupied seconds per bucket of ``bucket`` seconds between ``start`` and
+    ``end`` for ``intervals`` of (start_time, end_time) datetimes; an
+    end_time of None means still occupied at ``now`` (default ``end``).
+    Returns a list of floats, one per bucket.
+    """
+    nb = int(math.ceil((end - start).total_seconds() / bucket))
+    if nb <= 0:
+        return []
+    if np is not None:
+        return _occupied_numpy(_offsets_numpy(intervals, start, end, now), nb, bucket).tolist()
+    return _occupied_python(_offsets(intervals, start, end, now), nb, bucket)
+
+
+def _offsets_numpy(intervals, start, end, now):
+    """_offsets as an (n, 2) float array, clipped in bulk."""
+    now = min(now or end, end)
+    pairs = [(s, e if e is not None else now) for s, e in intervals if s is not None]
+    n = len(pairs)
+    se = np.empty((n, 2))
+    se[:, 0] = np.fromiter(((s - start).total_seconds() for s, _ in pairs), float, n)
+    se[:, 1] = np.fromiter(((e - start).total_seconds() for _, e in pairs), float, n)
+    np.clip(se, 0.0, (end - start).total_seconds(), out=se)
+    return se[se[:, 1] > se[:, 0]]
+
+
+def _occupied_numpy(spans, nb, bucket):
+    if not len(spans):
+        return np.zeros(nb)
+    s, e = spans[:, 0], spans[:, 1]
+    first_full = np.ceil(s / bucket).astype(np.int64)   # first bucket covered completely
+    end_full = np.floor(e / bucket).astype(np.int64)    # one past the last one
+
+    # full buckets: difference array + prefix sum
+    full = end_full > first_full
+    diff = np.bincount(first_full[full], minlength=nb + 1)[:nb + 1] \
+        - np.bincount(end_full[full], minlength=nb + 1)[:nb + 1]
+    seconds = np.cumsum(diff[:nb]) * float(bucket)
+
+    # partial ends; an interval inside a single bucket contributes e - s there
+    inside = end_full < first_full
+    head = np.where(inside, e - s, first_full * bucket - s)
+    head_idx = np.where(inside, np.floor(s / bucket), first_full - 1).astype(np.int64)
+    tail = np.where(inside, 0.0, e - end_full * bucket)
+    keep = head > 0
+    seconds += np.bincount(head_idx[keep], weights=head[keep], minlength=nb)[:nb]
+    keep = tail > 0
+    seconds += np.bincount(end_full[keep], weights=tail[keep], minlength=nb)[:nb]
+    return seconds
+
+
+def _occupied_python(spans, nb, bucket):
+    diff = [0] * (nb + 1)
+    seconds = [0.0] * nb
+    for s, e in spans:
+        first_full = int(math.ceil(s / bucket))
+        end_full = int(math.floor(e / bucket))
+        if end_full < first_full:
+            seconds[int(s // bucket)] += e - s
+            continue
+        if end_full > first_full:
+            diff[first_full] += 1
+            diff[end_full] -= 1
+        if first_full * bucket > s:
+            seconds[first_full - 1] += first_full * bucket - s
+        if e > end_full * bucket:
+            seconds[end_full] += e - end_full * bucket
+    running = 0
+    for i in range(nb):
+        running += diff[i]
+        seconds[i] += running * bucket
+    return seconds
+
+
+def hour_of_week_utilization(hourly_seconds, start, capacity):
+    """
+    Fold hourly occupied seconds (buckets starting at the hour-aligned
+    ``start``) into a 7 x 24 matrix (Monday first) of mean utilization,
+    occupied spot-hours / (capacity x hours observed), rounded to 4 places.
+    Hours of the week not covered by the window are None.
+    """
+    offset = start.weekday() * 24 + start.hour
+    n = len(hourly_seconds)
+    if np is not None and n:
+        slots = (offset + np.arange(n)) % HOURS_PER_WEEK
+        totals = np.bincount(slots, weights=np.asarray(hourly_seconds, dtype=float), minlength=HOURS_PER_WEEK).tolist()
+        counts = np.bincount(slots, minlength=HOURS_PER_WEEK).tolist()
+    else:
+        totals = [0.0] * HOURS_PER_WEEK
+        counts = [0] * HOURS_PER_WEEK
+        for i, value in enumerate(hourly_seconds):
+            slot = (offset + i) % HOURS_PER_WEEK
+            totals[slot] += value
+            counts[slot] += 1
+
+    cells = []
+    for slot in range(HOURS_PER_WEEK):
+        if not counts[slot]:
+            cells.append(None)
+        elif not capacity:
+            cells.append(0.0)
+        else:
+            cells.append(round(totals[slot] / (counts[slot] * HOUR * capacity), 4))
+    return [cells[d * 24:(d + 1) * 24] for d in range(7)]